@@ -0,0 +1,181 @@
+"""
+This module is for searching many screenshots in one pass.
+Features of all screenshots are extracted together as a query matrix,
+and the feature store is read once for all queries.
+"""
+
+import numpy as np
+from _modules import bruteforce
+from _modules import features
+from _modules import featurestore
+from _modules import flattree
+from _modules import metrics
+from _modules import searchtree
+
+##############################################################################
+# ----------Functions for external scripts: Batch Extraction and Search------
+##############################################################################
+
+
+def imagesToFeatures(images: list, rows: int, cols: int,
+                     dimensionRetained: int = 16):
+    """
+    Transforming screenshots to a query matrix.
+    ================================================================
+    Input:
+      images: list of images in OpenCV format, sizes may be different
+    Output:
+      array[image][dimensionRetained], one row of features per image
+    Same as features.framesToMeans() + features.meansToFeatures() for
+    each image, but images of the same size are averaged together and
+    all images are transformed by one DCT.
+    """
+    if (len(images) == 0):
+        return np.zeros((0, dimensionRetained), dtype=np.int64)
+    blockMeans = [None] * len(images)
+    sameSize = {}
+    for i in range(0, len(images)):
+        sameSize.setdefault(images[i].shape, []).append(i)
+    for size in sameSize:
+        group = sameSize[size]
+        groupMeans = features.framesToMeans(
+            np.stack([images[i] for i in group]), rows, cols)
+        for j in range(0, len(group)):
+            blockMeans[group[j]] = groupMeans[j]
+    return features.meansToFeatures(np.stack(blockMeans), dimensionRetained)
+
+
+@metrics.timed('query')
+def batchSearching(flatTree: dict, store: dict, queryMatrix,
+                   similarThreshold: float = 32, exactThreshold: float = 1):
+    """
+    Searching many features in flat index tree.
+    ================================================================
+    Output Format: list of (exactMatch, similarMatch, counter),
+        one for each row of queryMatrix, same as flattree.searching()
+    Queries are grouped by the leaf they reach, so that features of each
+    leaf are read and compared with all its queries at once.
+    """
+    queryMatrix = np.asarray(queryMatrix, dtype=np.int64)
+    bounds = flatTree['bounds']
+    firstChild = flatTree['firstChild']
+
+    # Step 1: Find the leaf of each query, same as flattree.searching()
+    queryLeaf = {}
+    results = [([], [], 0)] * len(queryMatrix)
+    for q in range(0, len(queryMatrix)):
+        node = int(flatTree['root'][0])
+        counter = 0
+        while (node >= 0 and firstChild[node] >= 0):
+            location = -1
+            for i in range(0, 8):
+                counter += 1
+                if (searchtree._compareBroundary(
+                        bounds[firstChild[node] + i], queryMatrix[q][0:3])):
+                    location = firstChild[node] + i
+                    break
+            node = location
+        if (node < 0):
+            # features is out of broundary of the tree
+            results[q] = ([], [], counter)
+        else:
+            queryLeaf.setdefault(node, []).append((q, counter))
+
+    # Step 2: Compare each leaf with all of its queries
+    for node in queryLeaf:
+        rows = flatTree['rows'][flatTree['leafStart'][node]:
+                                flatTree['leafEnd'][node]]
+        leafFeatures = np.asarray(store['features'][rows], dtype=np.int64)
+        leafTimes = np.asarray(store['times'][rows])
+        queries = [q for q, counter in queryLeaf[node]]
+        difference = (
+            leafFeatures[np.newaxis] -
+            queryMatrix[queries][:, np.newaxis]) ** 2
+        lowerBound = np.sqrt(difference[:, :, 0:3].sum(axis=2)) // 3
+        actual = np.sqrt(difference.sum(axis=2)) / difference.shape[2]
+        similar = lowerBound < similarThreshold
+        exact = similar & (actual < exactThreshold)
+        for j, (q, counter) in enumerate(queryLeaf[node]):
+            results[q] = (
+                featurestore.storeToVectors(
+                    {'times': leafTimes[exact[j]],
+                     'features': leafFeatures[exact[j]]}),
+                featurestore.storeToVectors(
+                    {'times': leafTimes[similar[j]],
+                     'features': leafFeatures[similar[j]]}),
+                counter + len(rows))
+    return results
+
+
+@metrics.timed('query')
+def batchKnnScanning(store: dict, queryMatrix, k: int,
+                     chunkElements: int = 1 << 24):
+    """
+    Searching k nearest feature vectors of many features by scanning.
+    ================================================================
+    Output Format: list of (nearestMatch, counter),
+        one for each row of queryMatrix, same as bruteforce.knnScanning()
+    Each chunk of feature matrix is compared with all queries by one
+    matrix multiplication:
+        |q - x| ^ 2 = |q| ^ 2 + |x| ^ 2 - 2 q.x
+    Chunks have at most chunkElements distances, so memory is bounded.
+    Features are integers, so float64 distances are exact.
+    """
+    if (k < 1):
+        raise ValueError('Number of nearest results must be at least 1.')
+    queryMatrix = np.asarray(queryMatrix, dtype=np.float64)
+    featureMatrix = store['features']
+    nQuery = len(queryMatrix)
+    if (nQuery == 0):
+        return []
+    chunkSize = max(1, chunkElements // nQuery)
+    queryNorm = (queryMatrix ** 2).sum(axis=1)[:, np.newaxis]
+
+    # bestRows & bestDistances = k nearest found so far for each query
+    bestRows = np.zeros((nQuery, 0), dtype=np.int64)
+    bestDistances = np.zeros((nQuery, 0))
+    for start in range(0, len(featureMatrix), chunkSize):
+        chunk = np.asarray(
+            featureMatrix[start:start + chunkSize], dtype=np.float64)
+        distances = (
+            queryNorm + (chunk ** 2).sum(axis=1)[np.newaxis] -
+            2 * (queryMatrix @ chunk.T))
+        candidateRows = np.broadcast_to(
+            np.arange(start, start + len(chunk)), distances.shape)
+        bestRows = np.concatenate([bestRows, candidateRows], axis=1)
+        bestDistances = np.concatenate([bestDistances, distances], axis=1)
+        if (bestRows.shape[1] > k):
+            keep = np.argpartition(bestDistances, k - 1, axis=1)[:, 0:k]
+            bestRows = np.take_along_axis(bestRows, keep, axis=1)
+            bestDistances = np.take_along_axis(bestDistances, keep, axis=1)
+
+    results = []
+    for q in range(0, nQuery):
+        # Sorted by distance, then by time for equal distances
+        order = np.lexsort((bestRows[q], bestDistances[q]))
+        distances = np.sqrt(np.maximum(bestDistances[q][order], 0))
+        results.append((
+            featurestore.rowsToVectors(
+                store, bestRows[q][order],
+                distances / queryMatrix.shape[1]),
+            len(featureMatrix)))
+    return results
+
+
+def batchKnnSearching(flatTree: dict, store: dict, queryMatrix, k: int):
+    """
+    Searching k nearest feature vectors of many features.
+    ================================================================
+    Output Format: list of (nearestMatch, counter), one for each query
+    Small feature stores are scanned with all queries together,
+    otherwise each query is searched by flattree.knnSearching().
+    """
+    if (k < 1):
+        raise ValueError('Number of nearest results must be at least 1.')
+    if (bruteforce.preferScanning(store) or flatTree is None):
+        return batchKnnScanning(store, queryMatrix, k)
+    results = []
+    for q in range(0, len(queryMatrix)):
+        results.append(flattree.knnSearching(
+            flatTree, store, np.asarray(queryMatrix[q]).tolist(), k))
+    return results
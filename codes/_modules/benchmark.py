@@ -0,0 +1,253 @@
+"""
+This module is for measuring speed, memory and recall of the application.
+Synthetic videos and screenshots are generated by OpenCV with a fixed
+seed, so results are reproducible and comparable across versions.
+"""
+
+import os
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from _modules import bruteforce
+from _modules import extraction
+from _modules import features
+from _modules import featurestore
+from _modules import flattree
+from _modules import quantized
+from _modules import searchtree
+
+# Scenario: (name, width, height, frameCount, content)
+#   content: "static"    = few slowly drifting shapes
+#            "motion"    = many fast moving shapes and camera noise
+#            "duplicate" = a short clip repeated many times
+SCENARIOS = [
+    ('static-240p', 320, 240, 300, 'static'),
+    ('motion-240p', 320, 240, 300, 'motion'),
+    ('duplicate-240p', 320, 240, 300, 'duplicate'),
+    ('motion-720p', 1280, 720, 120, 'motion'),
+]
+QUICK_SCENARIOS = [
+    ('static-120p', 160, 120, 60, 'static'),
+    ('motion-120p', 160, 120, 60, 'motion'),
+    ('duplicate-120p', 160, 120, 60, 'duplicate'),
+]
+
+##############################################################################
+# ----------Functions for external scripts: Generate and Measure----------
+##############################################################################
+
+
+def writeVideo(path: str, width: int, height: int, frameCount: int,
+               content: str, seed: int, fps: float = 30.0):
+    """
+    Writing a synthetic video by cv2.VideoWriter.
+    ================================================================
+    Output: path of video
+    Frames are drawn from random shapes of a fixed seed, so the same
+    video is generated for the same parameters.
+    """
+    random = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(
+        path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    nShape = 4 if content == 'static' else 24
+    speed = 0.5 if content == 'static' else 12.0
+    centers = random.uniform(0, 1, (nShape, 2)) * [width, height]
+    velocities = random.normal(0, speed, (nShape, 2))
+    colors = random.integers(0, 256, (nShape, 3))
+    radii = random.integers(4, max(5, min(width, height) // 6), nShape)
+    background = random.integers(0, 256, 3)
+    clipLength = max(1, frameCount // 10)
+
+    for count in range(0, frameCount):
+        step = count % clipLength if content == 'duplicate' else count
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[:] = background
+        for i in range(0, nShape):
+            x, y = (centers[i] + velocities[i] * step) % [width, height]
+            cv2.circle(frame, (int(x), int(y)), int(radii[i]),
+                       [int(c) for c in colors[i]], -1)
+        if (content == 'motion'):
+            noise = random.integers(-8, 9, frame.shape)
+            frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def screenshots(path: str, nQuery: int, seed: int):
+    """
+    Screenshots of random frames of a video, slightly blurred and
+    resized, as a user would capture them.
+    ================================================================
+    Output: list of (frame#, image)
+    """
+    random = np.random.default_rng(seed)
+    cap = cv2.VideoCapture(path)
+    fps, frameCount = extraction.videoMetadata(cap)
+    queries = []
+    for count in sorted(random.integers(0, frameCount, nQuery).tolist()):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, count)
+        nextFrame, frame = cap.read()
+        if (not nextFrame):
+            continue
+        height, width = frame.shape[0:2]
+        image = cv2.GaussianBlur(frame, (3, 3), 0)
+        image = cv2.resize(image, (width * 3 // 4, height * 3 // 4))
+        queries.append((count, image))
+    cap.release()
+    return queries
+
+
+def measure(results: dict, name: str, function, *args, **kwargs):
+    """
+    Running a function and recording its time and peak memory.
+    ================================================================
+    Output: output of the first run of the function
+    results[name] = {'seconds': wall time, 'peakBytes': peak memory}
+    The function is run twice: wall time is measured in the first run,
+    and peak memory is traced by tracemalloc in the second run, since
+    tracing slows down allocations a lot. tracemalloc counts allocations
+    of Python and NumPy, not memory of OpenCV.
+    """
+    start = time.perf_counter()
+    output = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    function(*args, **kwargs)
+    peakBytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results[name] = {'seconds': seconds, 'peakBytes': peakBytes}
+    return output
+
+
+def runScenario(folder: str, scenario: tuple, seed: int, rows: int = 2,
+                cols: int = 8, nSkip: int = 0, nQuery: int = 20, k: int = 5):
+    """
+    Measuring all stages of one scenario.
+    ================================================================
+    Output Format: dict of
+      'scenario': parameters of the scenario
+      'stages': {stage: {seconds, peakBytes}} for decode, frameToBlocks,
+                blocksToFeatures, extraction, indexing, searching, ...
+      'recall': {method: average recall against knnScanning()}
+      'counters': {method: average number of comparison per query}
+    frameToBlocks() and blocksToFeatures() are the original per-pixel
+    functions, they are measured on the first frame only.
+    """
+    name, width, height, frameCount, content = scenario
+    videoPath = os.path.join(folder, name + '.mp4')
+    writeVideo(videoPath, width, height, frameCount, content, seed)
+    stages = {}
+
+    # Decoding only, as a lower bound of extraction
+    def decodeAll():
+        cap = cv2.VideoCapture(videoPath)
+        count = 0
+        while (cap.grab()):
+            count += 1
+        cap.release()
+        return count
+    measure(stages, 'decode', decodeAll)
+
+    cap = cv2.VideoCapture(videoPath)
+    nextFrame, frame = cap.read()
+    cap.release()
+    blocks = measure(stages, 'frameToBlocks', features.frameToBlocks,
+                     frame.tolist(), rows, cols)
+    measure(stages, 'blocksToFeatures', features.blocksToFeatures, blocks)
+    measure(stages, 'framesToMeans', features.framesToMeans,
+            frame, rows, cols)
+
+    # Extraction and writing of feature store
+    storePath = os.path.join(
+        folder, f'{name}.{rows}x{cols}{featurestore.EXTENSION}')
+
+    def extractAll():
+        cap = cv2.VideoCapture(videoPath)
+        fps, count = extraction.videoMetadata(cap)
+        written = featurestore.writeStore(
+            storePath, extraction.extractFeatures(
+                cap, rows, cols, nSkip, showProgress=False),
+            fps, rows, cols, nSkip=nSkip)
+        cap.release()
+        return written
+    measure(stages, 'extraction', extractAll)
+    store = featurestore.loadStore(storePath)
+    featureVectors = featurestore.storeToVectors(store)
+    maxChild = max(1, int(len(featureVectors) ** 0.5))
+
+    # Indexing by nested tree, flat tree and codes
+    nestedTree = measure(stages, 'indexing', searchtree.indexing,
+                         featureVectors, maxChild)
+    flatTree = measure(stages, 'flatIndexing', flattree.indexing,
+                       store, maxChild)
+    codes = measure(stages, 'quantizing', quantized.quantizing, store)
+
+    # Searching screenshots, recall is against brute force
+    queries = screenshots(videoPath, nQuery, seed)
+    queryFeatures = [
+        features.meansToFeatures(features.framesToMeans(image, rows, cols))
+        for count, image in queries]
+    methods = {
+        'searching': lambda q: _nestedSearching(nestedTree, q),
+        'flatSearching': lambda q: flattree.searching(flatTree, store, q),
+        'knnScanning': lambda q: bruteforce.knnScanning(store, q, k),
+        'knnSearching': lambda q: flattree.knnSearching(
+            flatTree, store, q, k),
+        'quantizedSearching': lambda q: quantized.knnSearching(
+            codes, store, q, k),
+    }
+    outputs = {}
+    for method in methods:
+        outputs[method] = measure(
+            stages, method,
+            lambda: [methods[method](q) for q in queryFeatures])
+
+    recall = {}
+    counters = {}
+    groundTruth = [output[0] for output in outputs['knnScanning']]
+    for method in outputs:
+        counters[method] = float(np.mean(
+            [output[-1] for output in outputs[method]] or [0]))
+        if (method in ('knnSearching', 'quantizedSearching')):
+            recall[method] = float(np.mean([
+                bruteforce.recall(outputs[method][i][0], groundTruth[i])
+                for i in range(0, len(queryFeatures))] or [1.0]))
+    # Fraction of screenshots whose frame is found in similar matches
+    found = 0
+    for i in range(0, len(queries)):
+        similarTimes = [match[0] for match in outputs['searching'][i][1]]
+        nearestTimes = [match[0] for match in
+                        outputs['knnSearching'][i][0]]
+        if (any(abs(t * store['header']['fps'] - queries[i][0]) <=
+                nSkip + 1 for t in similarTimes + nearestTimes)):
+            found += 1
+    recall['frameFound'] = found / max(1, len(queries))
+
+    return {
+        'scenario': {'name': name, 'width': width, 'height': height,
+                     'frameCount': frameCount, 'content': content,
+                     'rows': rows, 'cols': cols, 'nSkip': nSkip,
+                     'queries': len(queries), 'k': k,
+                     'featureVectors': len(featureVectors)},
+        'stages': stages,
+        'recall': recall,
+        'counters': counters
+    }
+
+
+##############################################################################
+# ----------Functions for internal uses: Search in Nested Tree-------------
+##############################################################################
+
+
+def _nestedSearching(tree: list, queryFeature: list):
+    # searchtree.searching() needs the top-3 features within the boundary
+    # of root, a blurred screenshot may fall outside of it, which is a miss
+    low, high = tree[0][1:4], tree[0][4:7]
+    for i in range(0, 3):
+        if (queryFeature[i] < low[i] or queryFeature[i] > high[i]):
+            return [], [], 0
+    return searchtree.searching(tree, queryFeature)
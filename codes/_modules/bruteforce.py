@@ -0,0 +1,126 @@
+"""
+This module is for searching by scanning all feature vectors.
+Distances to the whole feature matrix are computed by NumPy in chunks,
+which is faster than tree search for small to mid-size videos.
+It is also the ground truth for measuring recall of tree search.
+"""
+
+import numpy as np
+from _modules import featurestore
+from _modules import metrics
+
+# Videos with feature vectors up to this number are searched by scanning
+SCAN_LIMIT = 200000
+
+##############################################################################
+# ----------Functions for external scripts: knnScanning() and recall()-------
+##############################################################################
+
+
+def preferScanning(store: dict):
+    """
+    Return true if a feature store is small enough for scanning,
+    otherwise an index tree should be used.
+    """
+    return len(store['times']) <= SCAN_LIMIT
+
+
+@metrics.timed('query')
+def knnScanning(store: dict, features: list, k: int, chunkSize: int = 65536,
+                counter=0):
+    """
+    Searching k nearest feature vectors by scanning the feature matrix.
+    ================================================================
+    Output Format: (nearestMatch, counter), same as flattree.knnSearching()
+        nearestMatch: list of [time, [features], distance], sorted by
+                      distance among all dimensions of features
+        counter: number of comparison
+    Feature matrix is processed in chunks of chunkSize rows, so memory
+    usage is bounded for huge feature stores.
+    """
+    if (k < 1):
+        raise ValueError('Number of nearest results must be at least 1.')
+    query = np.asarray(features, dtype=np.int64)
+    bestRows, bestDistances, counter = _nearestRows(
+        store['features'], query, k, chunkSize, counter)
+
+    # Sorted by distance, then by time for equal distances
+    order = np.lexsort((bestRows, bestDistances))
+    distances = np.sqrt(bestDistances[order]) / len(query)
+    return featurestore.rowsToVectors(
+        store, bestRows[order], distances), counter
+
+
+@metrics.timed('query')
+def knnCoarseToFine(coarseStore: dict, fineStore: dict,
+                    coarseFeatures: list, fineFeatures: list, k: int,
+                    shortlist: int = None, chunkSize: int = 65536):
+    """
+    Searching k nearest feature vectors in two levels of a feature pyramid.
+    ================================================================
+    Output Format: (nearestMatch, counter), same as knnScanning()
+    Stage 1: Coarse level, e.g. 1x1, is scanned for the nearest shortlist
+             rows (10 * k by default).
+    Stage 2: Shortlist is ranked by fine level, e.g. 2x8.
+    Both stores are levels of featurestore.levelStore() of one pyramid,
+    so rows are the same frames. Distances are of the fine level.
+    """
+    if (shortlist is None):
+        shortlist = 10 * k
+    shortlist = max(shortlist, k)
+    rows, coarseDistances, counter = _nearestRows(
+        coarseStore['features'], np.asarray(coarseFeatures, dtype=np.int64),
+        shortlist, chunkSize)
+    rows = np.sort(rows)
+    query = np.asarray(fineFeatures, dtype=np.int64)
+    candidates = np.asarray(fineStore['features'][rows], dtype=np.int64)
+    counter += len(rows)
+    distances = ((candidates - query) ** 2).sum(axis=1)
+    order = np.lexsort((rows, distances))[0:k]
+    return featurestore.rowsToVectors(
+        fineStore, rows[order], np.sqrt(distances[order]) / len(query)
+    ), counter
+
+
+def recall(nearestMatch: list, groundTruth: list):
+    """
+    Recall of a search result against the ground truth of knnScanning().
+    ================================================================
+    Output: fraction of the ground truth that is found, in [0, 1]
+    Frames are matched by distance, so that frames with equal distance
+    are interchangeable.
+    """
+    if (len(groundTruth) == 0):
+        return 1.0
+    threshold = groundTruth[-1][2] + 1e-9
+    found = 0
+    for i in range(0, len(nearestMatch)):
+        if (nearestMatch[i][2] <= threshold):
+            found += 1
+    return min(found, len(groundTruth)) / len(groundTruth)
+
+
+##############################################################################
+# ----------Functions for internal uses: Scan Feature Matrix----------
+##############################################################################
+
+
+def _nearestRows(featureMatrix, query, k: int, chunkSize: int, counter=0):
+    # Rows and squared distances of k nearest feature vectors, not sorted
+    bestRows = np.zeros(0, dtype=np.int64)
+    bestDistances = np.zeros(0, dtype=np.int64)
+    for start in range(0, len(featureMatrix), chunkSize):
+        chunk = np.asarray(featureMatrix[start:start + chunkSize], np.int64)
+        counter += len(chunk)
+        # Squared distance is enough for ranking
+        distances = ((chunk - query) ** 2).sum(axis=1)
+        if (len(distances) > k):
+            nearest = np.argpartition(distances, k - 1)[0:k]
+        else:
+            nearest = np.arange(len(distances))
+        bestRows = np.concatenate([bestRows, nearest + start])
+        bestDistances = np.concatenate([bestDistances, distances[nearest]])
+        if (len(bestRows) > k):
+            keep = np.argpartition(bestDistances, k - 1)[0:k]
+            bestRows, bestDistances = bestRows[keep], bestDistances[keep]
+    return bestRows, bestDistances, counter
@@ -0,0 +1,252 @@
+"""
+This module is for extracting feature vectors from a video in OpenCV format.
+Frames are decoded, reduced to features and discarded one by one,
+so memory usage does not grow with the length of video.
+"""
+
+import time
+import concurrent.futures
+import cv2
+import numpy as np
+from _modules import features
+from _modules import metrics
+
+##############################################################################
+# ----------Functions for external scripts: extractFeatures() & Parallel-----
+##############################################################################
+
+
+def videoMetadata(cap):
+    """
+    Reading metadata of an opened cv2.VideoCapture.
+    ================================================================
+    Output Format: (fps, frameCount)
+    """
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frameCount = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    return fps, frameCount
+
+
+def extractFeatures(cap, nRow: int, nCol: int, nSkip: int,
+                    dimensionRetained: int = 16, chunkSize: int = 64,
+                    startFrame: int = 0, stopFrame: int = None,
+                    showProgress: bool = True, levels: list = None):
+    """
+    Generator of feature vectors of sampled frames in a video.
+    ================================================================
+    Output Format:  [time, [features]] for every (nSkip + 1) frames
+    Frames are reduced to block averages as soon as they are decoded.
+    Block averages of up to chunkSize frames are kept in memory,
+    then transformed to features together by features.meansToFeatures().
+    For extracting a segment of video, cap must be positioned at
+    startFrame, which is a multiple of (nSkip + 1). Frames from stopFrame
+    onwards are not read.
+    levels: list of extra (rows, cols). Features of all grids are
+    concatenated, nRow x nCol first, see features.framesToPyramid().
+    """
+    grids = [(nRow, nCol)] + list(levels or [])
+    fps, frameCount = videoMetadata(cap)
+    if (stopFrame is None or stopFrame > frameCount):
+        stopFrame = frameCount
+    chunkTimes = []
+    chunkMeans = []
+
+    start = time.time()
+    for count, frame in _sampledFrames(cap, nSkip, startFrame, stopFrame):
+
+        # Show progress in percentage
+        now = time.time()
+        if (showProgress and (now - start) > 6):
+            progressPercentage = int(count / frameCount * 100)
+            print(f'> Progress: {progressPercentage}%')
+            start = time.time()
+
+        # Time serves as filePath, features serve as UniqueID of an image
+        chunkTimes.append(count / fps)
+        with metrics.stage('reduction'):
+            chunkMeans.append(features.framesToPyramid(frame, grids))
+        if (len(chunkMeans) >= chunkSize):
+            yield from _chunkToFeatures(
+                chunkTimes, chunkMeans, dimensionRetained)
+            chunkTimes, chunkMeans = [], []
+
+    if (len(chunkMeans) > 0):
+        yield from _chunkToFeatures(chunkTimes, chunkMeans, dimensionRetained)
+
+
+def extractAdaptive(cap, nRow: int, nCol: int, nSkip: int,
+                    threshold: float, maxGap: float,
+                    dimensionRetained: int = 16, chunkSize: int = 64,
+                    startFrame: int = 0, stopFrame: int = None,
+                    showProgress: bool = True, levels: list = None):
+    """
+    Generator of feature vectors of keyframes in a video.
+    ================================================================
+    Output Format:  [time, [features]], same as extractFeatures()
+    Every (nSkip + 1) frames are examined, but a frame is only kept if
+    its block averages differ from the last kept frame by more than
+    threshold (mean absolute difference in intensity, 0 - 255), or if
+    maxGap seconds are passed since the last kept frame.
+    A kept frame represents all frames until the next kept frame, see
+    featurestore.timeSpans(). Only kept frames are transformed by DCT.
+    Block averages of nRow x nCol are compared, for levels see above.
+    """
+    grids = [(nRow, nCol)] + list(levels or [])
+    fps, frameCount = videoMetadata(cap)
+    if (stopFrame is None or stopFrame > frameCount):
+        stopFrame = frameCount
+    chunkTimes = []
+    chunkMeans = []
+    lastMeans = None
+    lastCount = startFrame
+
+    start = time.time()
+    for count, frame in _sampledFrames(cap, nSkip, startFrame, stopFrame):
+
+        # Show progress in percentage
+        now = time.time()
+        if (showProgress and (now - start) > 6):
+            progressPercentage = int(count / frameCount * 100)
+            print(f'> Progress: {progressPercentage}%')
+            start = time.time()
+
+        # Block averages are the signature for comparing frames
+        with metrics.stage('reduction'):
+            pyramid = features.framesToPyramid(frame, grids)
+        means = pyramid[0]
+        if (lastMeans is not None and
+                (count - lastCount) / fps < maxGap and
+                np.abs(means - lastMeans).mean() <= threshold):
+            continue
+        lastMeans, lastCount = means, count
+        chunkTimes.append(count / fps)
+        chunkMeans.append(pyramid)
+        if (len(chunkMeans) >= chunkSize):
+            yield from _chunkToFeatures(
+                chunkTimes, chunkMeans, dimensionRetained)
+            chunkTimes, chunkMeans = [], []
+
+    if (len(chunkMeans) > 0):
+        yield from _chunkToFeatures(chunkTimes, chunkMeans, dimensionRetained)
+
+
+def resumeFrame(savedTimes, fps: float, nSkip: int):
+    """
+    Frame index to resume extraction after the saved timestamps,
+    e.g. featurestore.checkpoint() of an interrupted store.
+    Output: frame index, which is a multiple of (nSkip + 1)
+    """
+    if (savedTimes is None or len(savedTimes) == 0):
+        return 0
+    return int(round(savedTimes[-1] * fps)) + nSkip + 1
+
+
+def extractParallel(videoPath: str, nRow: int, nCol: int, nSkip: int,
+                    nWorker: int, dimensionRetained: int = 16,
+                    startFrame: int = 0, threshold: float = None,
+                    maxGap: float = None, levels: list = None):
+    """
+    Generator of feature vectors, extracted by multiple processes.
+    ================================================================
+    Output Format:  [time, [features]], same as extractFeatures()
+    The sampled frames are divided into nWorker segments of frame index.
+    Each segment is extracted by its own cv2.VideoCapture in a process
+    pool, and results are yielded in the order of time.
+    Every segment starts at a sampled frame, so the output is the same as
+    a serial run, as long as the video supports frame-accurate seeking.
+    Frames before startFrame, a multiple of (nSkip + 1), are not read.
+    If threshold is given, keyframes are sampled by extractAdaptive(),
+    and the first frame of each segment is always kept.
+    """
+    cap = cv2.VideoCapture(videoPath)
+    fps, frameCount = videoMetadata(cap)
+    cap.release()
+
+    # Divide sampled frames into segments of (nearly) equal size
+    step = nSkip + 1
+    nSample = max(0, (frameCount - startFrame + step - 1) // step)
+    nWorker = max(1, min(nWorker, nSample))
+    segments = []
+    for i in range(0, nWorker):
+        segmentStart = startFrame + (i * nSample // nWorker) * step
+        segmentStop = min(
+            startFrame + ((i + 1) * nSample // nWorker) * step, frameCount)
+        segments.append(
+            (videoPath, segmentStart, segmentStop,
+             nRow, nCol, nSkip, dimensionRetained, threshold, maxGap,
+             levels, metrics.enabled()))
+
+    # Results of Executor.map() are in the same order as segments
+    with concurrent.futures.ProcessPoolExecutor(nWorker) as pool:
+        for i, (segmentFeatures, segmentMetrics) in enumerate(
+                pool.map(_extractSegment, segments)):
+            print(f'> Progress: segment {i + 1} of {nWorker} is done')
+            # Stage times and frames of worker processes are sent back
+            if (segmentMetrics is not None):
+                metrics.merge(segmentMetrics)
+            yield from segmentFeatures
+
+
+##############################################################################
+# ----------Functions for internal uses: Decode and Transform Frames----------
+##############################################################################
+
+
+def _sampledFrames(cap, nSkip: int, startFrame: int, stopFrame: int):
+    # Generator of (frame#, frame) for every (nSkip + 1) frames.
+    # Skipped frames are passed over by grab(), which does not retrieve
+    # and convert the decoded picture.
+    count = startFrame
+    while (count < stopFrame):
+        with metrics.stage('decode'):
+            nextFrame, frame = cap.read()
+        if (not nextFrame):
+            return
+        metrics.count('frames')
+        yield count, frame
+        with metrics.stage('decode'):
+            for i in range(0, nSkip):
+                if (not cap.grab()):
+                    return
+        count += nSkip + 1
+
+
+def _extractSegment(segment: tuple):
+    # Extract a segment of video in a worker process.
+    # Each process opens its own cv2.VideoCapture and seeks to startFrame.
+    # Output: (segmentFeatures, snapshot of metrics or None)
+    (videoPath, startFrame, stopFrame, nRow, nCol, nSkip, dimension,
+     threshold, maxGap, levels, collectMetrics) = segment
+    if (collectMetrics):
+        metrics.enable()
+        metrics.reset()
+    cap = cv2.VideoCapture(videoPath)
+    if (startFrame > 0):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, startFrame)
+    if (threshold is None):
+        segmentFeatures = list(extractFeatures(
+            cap, nRow, nCol, nSkip, dimension,
+            startFrame=startFrame, stopFrame=stopFrame, showProgress=False,
+            levels=levels))
+    else:
+        segmentFeatures = list(extractAdaptive(
+            cap, nRow, nCol, nSkip, threshold, maxGap, dimension,
+            startFrame=startFrame, stopFrame=stopFrame, showProgress=False,
+            levels=levels))
+    cap.release()
+    if (not collectMetrics):
+        return segmentFeatures, None
+    return segmentFeatures, metrics.snapshot()
+
+
+def _chunkToFeatures(chunkTimes: list, chunkMeans: list,
+                     dimensionRetained: int):
+    # Transform block averages of a chunk of frames by one DCT for each
+    # grid, then features of all grids are concatenated
+    with metrics.stage('dct'):
+        chunkFeatures = np.concatenate([
+            features.meansToFeatures(
+                [pyramid[level] for pyramid in chunkMeans], dimensionRetained)
+            for level in range(0, len(chunkMeans[0]))], axis=1)
+    for i in range(0, len(chunkTimes)):
+        yield [chunkTimes[i], chunkFeatures[i].tolist()]
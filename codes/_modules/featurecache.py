@@ -0,0 +1,217 @@
+"""
+This module is for caching extracted features on disk.
+Files are keyed by a fingerprint of their content plus the parameters of
+extraction, so a renamed copy of a video or a repeated screenshot is not
+extracted again. Least recently used files are evicted when the cache
+is larger than its budget.
+A feature store is cached as a hard link when the file system allows,
+otherwise as a full copy, which doubles disk usage of each video.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import cv2
+import numpy as np
+from _modules import features
+
+FOLDER = 'output/cache'
+BUDGET = 2 * 1024 ** 3
+SAMPLE_SIZE = 1 << 16
+SAMPLE_COUNT = 16
+
+##############################################################################
+# ----------Functions for external scripts: FeatureCache and Fingerprint-----
+##############################################################################
+
+
+class FeatureCache:
+    """
+    LRU cache of files on disk under a size budget.
+    ================================================================
+    folder: folder of cached files, created if it does not exist
+    budgetBytes: total size of cached files, hard links are counted
+    Files are named by key, and access time is their last use, so
+    modified time of a hard-linked feature store is not changed.
+    """
+
+    def __init__(self, folder: str = FOLDER, budgetBytes: int = BUDGET):
+        self.folder = folder
+        self.budgetBytes = budgetBytes
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, key: str, extension: str):
+        return os.path.join(self.folder, key + extension)
+
+    def get(self, key: str, extension: str):
+        """
+        Output: path of a cached file, or None if it is not cached.
+        """
+        path = self.path(key, extension)
+        try:
+            _touch(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, extension: str, sourcePath: str):
+        """
+        Adding a file into the cache, then evicting old files.
+        The file is hard-linked, or copied if hard links are not
+        supported, e.g. on another device. A hard-linked file shares its
+        content with the cache, so it must be replaced rather than
+        rewritten in place, as featurestore.writeStore() and
+        appendStore() do.
+        """
+        path = self.path(key, extension)
+        temporaryPath = _temporaryPath(path)
+        try:
+            os.link(sourcePath, temporaryPath)
+        except OSError:
+            shutil.copyfile(sourcePath, temporaryPath)
+        os.replace(temporaryPath, path)
+        _touch(path)
+        self.evict()
+        return path
+
+    def getArray(self, key: str):
+        # Cached array saved by putArray(), or None
+        path = self.get(key, '.npy')
+        if (path is None):
+            return None
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+
+    def putArray(self, key: str, array):
+        path = self.path(key, '.npy')
+        temporaryPath = _temporaryPath(path)
+        arrayFile = open(temporaryPath, 'wb')
+        np.save(arrayFile, np.asarray(array))
+        arrayFile.close()
+        os.replace(temporaryPath, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Removing least recently used files until the cache fits its budget.
+        Output: number of removed files
+        """
+        entries = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if (not name.endswith('.tmp') and os.path.isfile(path)):
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((status.st_atime_ns, status.st_size, path))
+        entries.sort()
+        usedBytes = sum(entry[1] for entry in entries)
+        removed = 0
+        # The most recently used file is kept, even if it is over budget
+        while (usedBytes > self.budgetBytes and removed < len(entries) - 1):
+            usedBytes -= entries[removed][1]
+            # A file may be evicted by another process at the same time
+            try:
+                os.remove(entries[removed][2])
+            except FileNotFoundError:
+                pass
+            removed += 1
+        return removed
+
+
+def fingerprint(path: str):
+    """
+    Fast fingerprint of a video file.
+    ================================================================
+    Output: SHA-256 in hex of file size, the beginning of file, which
+    has the container header, and SAMPLE_COUNT byte ranges spread evenly
+    over the file. A file smaller than all ranges is hashed entirely.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode('utf-8'))
+    videoFile = open(path, 'rb')
+    if (size <= SAMPLE_SIZE * (SAMPLE_COUNT + 1)):
+        digest.update(videoFile.read())
+    else:
+        digest.update(videoFile.read(SAMPLE_SIZE))
+        for i in range(1, SAMPLE_COUNT + 1):
+            videoFile.seek((size - SAMPLE_SIZE) * i // SAMPLE_COUNT)
+            digest.update(videoFile.read(SAMPLE_SIZE))
+    videoFile.close()
+    return digest.hexdigest()
+
+
+def cacheKey(contentHash: str, **parameters):
+    """
+    Key of cache for a fingerprint and parameters of extraction,
+    e.g. cacheKey(fingerprint(path), rows=2, cols=8, nSkip=0, dimension=16)
+    """
+    text = json.dumps([contentHash, parameters], sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def restoreFile(cachedPath: str, targetPath: str):
+    """
+    Copying a cached file, e.g. from FeatureCache.get(), to targetPath.
+    ================================================================
+    Output: false if targetPath is already the cached file, e.g. the
+            hard link made by put() when the same video is extracted
+            again, so nothing is copied
+    Otherwise targetPath is replaced by a full copy, not a hard link, so
+    its header can be updated in place without changing the cache.
+    """
+    if (os.path.exists(targetPath) and
+            os.path.samefile(cachedPath, targetPath)):
+        return False
+    temporaryPath = _temporaryPath(targetPath)
+    shutil.copyfile(cachedPath, temporaryPath)
+    os.replace(temporaryPath, targetPath)
+    return True
+
+
+def imageFeatures(cache: FeatureCache, path: str, rows: int, cols: int,
+                  dimensionRetained: int = 16):
+    """
+    Features of an image file, read from cache if it is searched before.
+    ================================================================
+    Output: list[dimensionRetained], same as features.meansToFeatures(),
+            or None if the image cannot be read
+    Images are small, so they are fingerprinted by their whole content.
+    """
+    imageFile = open(path, 'rb')
+    digest = hashlib.sha256(imageFile.read()).hexdigest()
+    imageFile.close()
+    key = cacheKey(digest, rows=rows, cols=cols, dimension=dimensionRetained)
+    cached = cache.getArray(key)
+    if (cached is not None):
+        return cached.tolist()
+
+    image = cv2.imread(path)
+    if (image is None):
+        return None
+    imageFeature = features.meansToFeatures(
+        features.framesToMeans(image, rows, cols), dimensionRetained)
+    cache.putArray(key, imageFeature)
+    return imageFeature
+
+
+##############################################################################
+# ----------Functions for internal uses: Last Use and Temporary File-------
+##############################################################################
+
+
+def _touch(path: str):
+    # Access time is set to now as the last use, modified time is kept
+    status = os.stat(path)
+    os.utime(path, ns=(time.time_ns(), status.st_mtime_ns))
+
+
+def _temporaryPath(path: str):
+    # Temporary file of a process and thread, so writers do not clash
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
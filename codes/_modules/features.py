@@ -4,6 +4,7 @@ This module is for feature extraction for an image in OpenCV format.
 
 import numpy as np
 import math
+import functools
 
 
 def frameToBlocks(rawFrame: list, rows: int, cols: int):
@@ -51,7 +52,98 @@ def frameToBlocks(rawFrame: list, rows: int, cols: int):
     return imageBlocks
 
 
-def blocksToFeatures(rawBlocks: list):
+def framesToMeans(rawFrames, rows: int, cols: int):
+    """
+    This function is for averaging blocks of frames in a vectorized way.
+    ================================================================
+    Input:
+      rawFrames: array[height][width][channel] = intensity, or
+                 array[frame][height][width][channel] for stacked frames
+    Output: (for example)
+      framesToMeans(rawFrame, 2, 3) = array[24] for a single frame, or
+      framesToMeans(rawFrames, 2, 3) = array[frame][24] for stacked frames
+    where
+      output[p] = sum(blocks[p]) // len(blocks[p])
+    and blocks = frameToBlocks(rawFrame, 2, 3).
+    As in frameToBlocks(), remainder rows and columns are folded into
+    the last block, so the averages are identical to blocksToFeatures().
+    """
+    frames = np.asarray(rawFrames)
+    rawH, rawW, rawC = frames.shape[-3:]
+    rowEdges = _blockEdges(rawH, rows)
+    colEdges = _blockEdges(rawW, cols)
+
+    # Sum pixels of each block: first along height, then along width
+    sums = np.add.reduceat(frames, rowEdges, axis=-3, dtype=np.int64)
+    sums = np.add.reduceat(sums, colEdges, axis=-2)
+    return _sumsToMeans(sums, rowEdges, colEdges, rawH, rawW)
+
+
+def framesToPyramid(rawFrames, grids: list):
+    """
+    This function is for averaging blocks of frames in several grid sizes.
+    ================================================================
+    Input:
+      rawFrames: same as framesToMeans()
+      grids: list of (rows, cols), e.g. [(1, 1), (2, 2), (4, 4), (2, 8)]
+    Output:
+      list of framesToMeans(rawFrames, rows, cols), one for each grid
+    Pixels are summed once in the finest grid that all grids fit in,
+    e.g. 4x8 for the grids above. Sums of its blocks are added up into
+    the coarser grids, which is exact as long as block edges of a grid
+    are also edges of the finest grid. Otherwise, the grid is averaged
+    from pixels by framesToMeans().
+    """
+    frames = np.asarray(rawFrames)
+    rawH, rawW, rawC = frames.shape[-3:]
+    fineRows = int(np.lcm.reduce([grid[0] for grid in grids]))
+    fineCols = int(np.lcm.reduce([grid[1] for grid in grids]))
+    if (fineRows > rawH or fineCols > rawW):
+        return [framesToMeans(frames, rows, cols) for rows, cols in grids]
+    fineRowEdges = _blockEdges(rawH, fineRows)
+    fineColEdges = _blockEdges(rawW, fineCols)
+    fineSums = np.add.reduceat(frames, fineRowEdges, axis=-3, dtype=np.int64)
+    fineSums = np.add.reduceat(fineSums, fineColEdges, axis=-2)
+
+    output = []
+    for rows, cols in grids:
+        rowEdges = _blockEdges(rawH, rows)
+        colEdges = _blockEdges(rawW, cols)
+        rowIndex = np.minimum(
+            np.searchsorted(fineRowEdges, rowEdges), fineRows - 1)
+        colIndex = np.minimum(
+            np.searchsorted(fineColEdges, colEdges), fineCols - 1)
+        if (not np.array_equal(fineRowEdges[rowIndex], rowEdges) or
+                not np.array_equal(fineColEdges[colIndex], colEdges)):
+            output.append(framesToMeans(frames, rows, cols))
+            continue
+        sums = np.add.reduceat(fineSums, rowIndex, axis=-3)
+        sums = np.add.reduceat(sums, colIndex, axis=-2)
+        output.append(_sumsToMeans(sums, rowEdges, colEdges, rawH, rawW))
+    return output
+
+
+def _sumsToMeans(sums, rowEdges, colEdges, rawH: int, rawW: int):
+    # Divide sums of blocks by their number of pixels
+    rows, cols, rawC = sums.shape[-3:]
+    counts = np.multiply.outer(
+        np.diff(np.append(rowEdges, rawH)),
+        np.diff(np.append(colEdges, rawW)))
+    means = sums // counts[:, :, np.newaxis]
+
+    # Reorder [row][col][channel] to the block number of frameToBlocks()
+    means = np.swapaxes(means, -3, -2)
+    return means.reshape(means.shape[:-3] + (rows * cols * rawC,))
+
+
+def _blockEdges(length: int, nBlock: int):
+    # Start index of each block along one axis.
+    # The last block extends to the end of axis, e.g. _blockEdges(10, 3):
+    #   [0, 3, 6] ---> blocks [0:3], [3:6], [6:10]
+    return np.arange(nBlock) * (length // nBlock)
+
+
+def blocksToFeatures(rawBlocks: list, dimensionRetained: int = 16):
     """
     This function is for transforming blocks to feature vectors.
     ================================================================
@@ -60,17 +152,52 @@ def blocksToFeatures(rawBlocks: list):
     {Simplified Principal Component Analysis }
       Then reduce the dimension by discret consine transform.
       Truncate the transformed feature vector.
-      From (Row*Col*ColorChannel)-demensions to 16-demensions.
+      From (Row*Col*ColorChannel)-demensions to 16-demensions by default,
+      or to dimensionRetained-demensions.
     """
     tempFeaures = []
-    blocksFeatures = []
     # Calculate average intensity for each block
     for p in range(0, len(rawBlocks)):
         tempFeaures.append(sum(rawBlocks[p]) // len(rawBlocks[p]))
     # Run discrete consine transfrom on color information
-        # TBC
-        blocksFeatures = _discretConsineTransform(tempFeaures, 16)
-    return blocksFeatures
+    return meansToFeatures(tempFeaures, dimensionRetained)
+
+
+def meansToFeatures(blockMeans, dimensionRetained: int = 16):
+    """
+    This function is for transforming average intensity of blocks,
+    e.g. output of framesToMeans(), to feature vectors.
+    ================================================================
+    Input:
+      blockMeans: list[block] for a single frame, or
+                  array[frame][block] with one row per frame
+      dimensionRetained: dimension of feature vectors, 16 by default
+    Output:
+      list[dimensionRetained] for a single frame, same as blocksToFeatures()
+      array[frame][dimensionRetained] for multiple frames, each row is
+      the same as the output for a single frame
+    All frames are transformed by a single matrix multiplication.
+    """
+    means = np.asarray(blockMeans)
+    if (means.ndim == 1):
+        return _discretConsineTransform(means.tolist(), dimensionRetained)
+
+    # No transform if original dimension = 1
+    if (means.shape[1] == 1):
+        return means.astype(np.int64)
+    basis = _discretConsineBasis(means.shape[1], dimensionRetained)
+    transformed = means.astype(np.float64) @ basis.T
+    # Matrix multiplication sums in another order than np.dot(), so a
+    # value close to an integer may be truncated to another integer,
+    # except 0. Frames with such values are transformed again frame by
+    # frame, so features are the same as blocksToFeatures().
+    rounded = np.round(transformed)
+    nearInteger = (np.abs(transformed - rounded) < 1e-6) & (rounded != 0)
+    for i in np.flatnonzero(np.any(nearInteger, axis=1)):
+        transformed[i] = _discretConsineTransform(
+            means[i].tolist(), dimensionRetained)
+    # Converting to integer truncates toward zero, same as int()
+    return transformed.astype(np.int64)
 
 
 def _discretConsineTransform(rawVector: list, dimensionRetained: int):
@@ -84,27 +211,34 @@ def _discretConsineTransform(rawVector: list, dimensionRetained: int):
     if (len(rawVector) == 1):
         return rawVector
 
-    # Create Matrix for DCT
-    dimensionOriginal = len(rawVector)
-    transformVectors = [[]]
+    # Matrix for DCT is created once for each dimension, see below
+    basis = _discretConsineBasis(len(rawVector), dimensionRetained)
     resultVector = []
+    for p in range(0, dimensionRetained):
+        resultVector.append(int(np.dot(basis[p], rawVector)))
+    return resultVector
+
+
+@functools.lru_cache(maxsize=32)
+def _discretConsineBasis(dimensionOriginal: int, dimensionRetained: int):
+    # Truncated DCT matrix in size of [dimensionRetained][dimensionOriginal].
+    # It is cached for each pair of dimensions, so cosine is only evaluated
+    # once for all frames of a video. Rows beyond dimensionOriginal are 0.
+    basis = np.zeros((dimensionRetained, dimensionOriginal))
     normalizedCoeff = math.sqrt(2/dimensionOriginal)
 
     # For u = 0
     for q in range(0, dimensionOriginal):
-        transformVectors[0].append(1 / math.sqrt(dimensionOriginal))
-    resultVector.append(int(np.dot(transformVectors[0], rawVector)))
+        basis[0][q] = 1 / math.sqrt(dimensionOriginal)
     # For u > 0
-    for p in range(1, dimensionRetained):
-        transformVectors.append([])
+    for p in range(1, min(dimensionRetained, dimensionOriginal)):
         for q in range(0, dimensionOriginal):
-            if (p >= dimensionOriginal):
-                transformVectors[p].append(0)
-            else:
-                transformVectors[p].append(
-                    normalizedCoeff *
-                    math.cos(
-                        ((2 * q + 1) * p * math.pi) /
-                        (2 * dimensionOriginal)))
-        resultVector.append(int(np.dot(transformVectors[p], rawVector)))
-    return resultVector
+            basis[p][q] = (
+                normalizedCoeff *
+                math.cos(
+                    ((2 * q + 1) * p * math.pi) /
+                    (2 * dimensionOriginal)))
+
+    # Cached matrix is shared, so it must not be modified by callers
+    basis.setflags(write=False)
+    return basis
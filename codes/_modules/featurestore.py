@@ -0,0 +1,449 @@
+"""
+This module is for saving and loading feature vectors on disk.
+Feature vectors are stored in a compact binary format, which can be
+opened by numpy.memmap without parsing the whole file.
+Feature vectors in JSON format are still readable.
+"""
+
+import os
+import json
+import array
+import numpy as np
+from _modules import metrics
+
+# File Format:
+#   [0, HEADER_SIZE)        Magic number + header in JSON, padded by spaces
+#   [featuresOffset, ...)   Feature matrix, array[count][width] of dtype
+#   [timesOffset, ...)      Timestamp column, array[count] of float64
+# Header = {fps, rows, cols, dimension, source, video, nSkip, count, dtype,
+#           featuresOffset, timesOffset, endTime, sampling, levels}
+#   video: absolute path of the source video, None if unknown
+#   endTime: end of the last frame in seconds, None if unknown
+#   sampling: {threshold, maxGap} of adaptive sampling, None if fixed
+#   levels: [[rows, cols], ...] of a feature pyramid, None for one grid.
+#           Each row has features of all levels side by side, the first
+#           level is [rows, cols] of header, so width = dimension * levels
+MAGIC = b'SSVFEAT1'
+HEADER_SIZE = 4096
+EXTENSION = '.feat'
+
+##############################################################################
+# ----------Functions for external scripts: writeStore() and loadStore()------
+##############################################################################
+
+
+def writeStore(path: str, frameFeatures, fps: float, rows: int, cols: int,
+               dimension: int = 16, source: str = '', nSkip: int = None,
+               chunkSize: int = 4096, resume: bool = False,
+               endTime: float = None, sampling: dict = None,
+               levels: list = None, video: str = None):
+    """
+    Writing feature vectors into a binary feature store.
+    ================================================================
+    Input:
+      frameFeatures: iterable of [time, [features]], e.g. a generator
+      resume: if true, continue an interrupted store, see checkpoint()
+      endTime: end of video in seconds, for time span of the last frame
+      sampling: parameters of adaptive sampling, None for fixed nSkip
+      levels: extra (rows, cols) of a feature pyramid, features of all
+              levels are concatenated in [features], see above
+      video: path of the source video, saved as an absolute path
+    Output:
+      number of feature vectors written
+    Feature vectors are written in chunks, so frameFeatures is never
+    fully kept in memory. Header is completed after the last chunk.
+    Timestamps of written chunks are saved in a checkpoint file, so an
+    interrupted store can be resumed from its last chunk.
+    """
+    header = {
+        'fps': fps,
+        'rows': rows,
+        'cols': cols,
+        'dimension': dimension,
+        'source': source,
+        'video': os.path.abspath(video) if video else None,
+        'nSkip': nSkip,
+        'count': 0,
+        'dtype': _featureType(rows * cols * 3),
+        'featuresOffset': HEADER_SIZE,
+        'timesOffset': HEADER_SIZE,
+        'endTime': endTime,
+        'sampling': sampling,
+        'levels': None
+    }
+    if (levels):
+        header['levels'] = [[rows, cols]] + [list(grid) for grid in levels]
+        header['dtype'] = _featureType(
+            max(grid[0] * grid[1] for grid in header['levels']) * 3)
+    width = _rowWidth(header)
+    times = array.array('d')
+    chunk = []
+
+    savedTimes = checkpoint(path) if resume else None
+    if (savedTimes is not None):
+        # Only rows with saved timestamps are kept, the rest is rewritten
+        header = readHeader(path)
+        times.extend(savedTimes)
+        width = _rowWidth(header)
+        rowBytes = width * np.dtype(header['dtype']).itemsize
+        storeFile = open(path, 'r+b')
+        storeFile.seek(header['featuresOffset'] + len(times) * rowBytes)
+        storeFile.truncate()
+    else:
+        # An old store is removed rather than truncated, since it may be
+        # hard-linked by featurecache
+        if (os.path.exists(path)):
+            os.remove(path)
+        storeFile = open(path, 'wb')
+        storeFile.write(_packHeader(header))
+    checkpointFile = open(checkpointPath(path), 'wb')
+    checkpointFile.write(np.asarray(times, dtype='<f8').tobytes())
+    checkpointFile.flush()
+
+    for frameFeature in frameFeatures:
+        chunk.append(frameFeature)
+        if (len(chunk) >= chunkSize):
+            _writeChunk(storeFile, checkpointFile, times, chunk,
+                        width, header['dtype'])
+            chunk = []
+    if (len(chunk) > 0):
+        _writeChunk(storeFile, checkpointFile, times, chunk,
+                    width, header['dtype'])
+    checkpointFile.close()
+
+    _finishStore(storeFile, header, times)
+    storeFile.close()
+    os.remove(checkpointPath(path))
+    return header['count']
+
+
+def appendStore(path: str, frameFeatures, chunkSize: int = 4096,
+                endTime: float = None):
+    """
+    Appending feature vectors to the end of a binary feature store,
+    e.g. features of a newly recorded continuation of a stream.
+    ================================================================
+    Output: number of feature vectors appended
+    Existing feature matrix is copied as raw bytes into a new file,
+    which replaces the store when it is completed, so the store is
+    never half-written. endTime is the new end of video in seconds.
+    """
+    header = readHeader(path)
+    width = _rowWidth(header)
+    rowBytes = width * np.dtype(header['dtype']).itemsize
+    oldCount = header['count']
+    times = array.array('d')
+    if (oldCount > 0):
+        times.extend(np.memmap(
+            path, dtype='<f8', mode='r',
+            offset=header['timesOffset'], shape=(oldCount,)))
+
+    storeFile = open(path + '.tmp', 'wb')
+    storeFile.write(_packHeader(header))
+    oldFile = open(path, 'rb')
+    oldFile.seek(header['featuresOffset'])
+    remaining = oldCount * rowBytes
+    while (remaining > 0):
+        block = oldFile.read(min(remaining, 1 << 24))
+        storeFile.write(block)
+        remaining -= len(block)
+    oldFile.close()
+
+    chunk = []
+    for frameFeature in frameFeatures:
+        chunk.append(frameFeature)
+        if (len(chunk) >= chunkSize):
+            _writeChunk(storeFile, None, times, chunk,
+                        width, header['dtype'])
+            chunk = []
+    if (len(chunk) > 0):
+        _writeChunk(storeFile, None, times, chunk,
+                    width, header['dtype'])
+
+    header['endTime'] = endTime
+    _finishStore(storeFile, header, times)
+    storeFile.close()
+    os.replace(path + '.tmp', path)
+    return header['count'] - oldCount
+
+
+def checkpoint(path: str):
+    """
+    Timestamps of feature vectors written by an interrupted writeStore().
+    ================================================================
+    Output: array of timestamps, or None if there is no checkpoint.
+    A timestamp is only saved after its feature vector is written, so
+    they are all safely stored in the feature store.
+    """
+    if (not os.path.exists(checkpointPath(path)) or
+            not os.path.exists(path)):
+        return None
+    checkpointFile = open(checkpointPath(path), 'rb')
+    block = checkpointFile.read()
+    checkpointFile.close()
+    # A partly written timestamp at the end is dropped
+    block = block[0:len(block) // 8 * 8]
+    return np.frombuffer(block, dtype='<f8')
+
+
+def checkpointPath(path: str):
+    # e.g. "output/sample.mp4.2x8.feat" ---> "output/sample.mp4.2x8.feat.part"
+    return path + '.part'
+
+
+def loadStore(path: str):
+    """
+    Loading feature vectors from a binary feature store or a JSON file.
+    ================================================================
+    Output Format: dict of
+      'header': dict of {fps, rows, cols, dimension, source, nSkip, count,
+                         endTime, sampling, levels}
+      'times': array[count] of timestamps
+      'features': array[count][dimension] of features
+      'levels': dict of {"RxC": array[count][dimension]} for a pyramid
+    For a binary feature store, arrays are numpy.memmap, which are
+    loaded lazily from disk when they are accessed.
+    """
+    if (not isStore(path)):
+        return _loadJson(path)
+
+    header = readHeader(path)
+    count, dimension = header['count'], header['dimension']
+    width = _rowWidth(header)
+    if (count == 0):
+        times = np.zeros(0)
+        featureMatrix = np.zeros((0, width), dtype=header['dtype'])
+    else:
+        times = np.memmap(
+            path, dtype='<f8', mode='r',
+            offset=header['timesOffset'], shape=(count,))
+        featureMatrix = np.memmap(
+            path, dtype=header['dtype'], mode='r',
+            offset=header['featuresOffset'], shape=(count, width))
+    store = {'header': header, 'times': times,
+             'features': featureMatrix[:, 0:dimension]}
+    if (header.get('levels')):
+        store['levels'] = {}
+        for i, (rows, cols) in enumerate(header['levels']):
+            store['levels'][f'{rows}x{cols}'] = (
+                featureMatrix[:, i * dimension:(i + 1) * dimension])
+    return store
+
+
+def levelStore(store: dict, rows: int, cols: int):
+    """
+    A level of a feature pyramid as a feature store of its own grid size,
+    which can be searched in the same way as a feature store.
+    Output: feature store, or None if the grid size is not stored.
+    """
+    header = store['header']
+    if ((rows, cols) == (header['rows'], header['cols'])):
+        return store
+    key = f'{rows}x{cols}'
+    if (key not in store.get('levels', {})):
+        return None
+    levelHeader = dict(header, rows=rows, cols=cols)
+    return {'header': levelHeader, 'times': store['times'],
+            'features': store['levels'][key]}
+
+
+def readHeader(path: str):
+    """
+    Reading only the header of a binary feature store, without mapping
+    its arrays, e.g. for checking parameters of extraction.
+    Output: dict of header, see File Format above
+    """
+    storeFile = open(path, 'rb')
+    block = storeFile.read(HEADER_SIZE)
+    storeFile.close()
+    if (block[0:len(MAGIC)] != MAGIC):
+        raise ValueError('Not a feature store: ' + path)
+    return json.loads(block[len(MAGIC):].decode('utf-8'))
+
+
+def updateHeader(path: str, **fields):
+    """
+    Updating fields of header of a binary feature store in place,
+    e.g. updateHeader(path, source='copy.mp4') for a copied store.
+    """
+    header = readHeader(path)
+    header.update(fields)
+    storeFile = open(path, 'r+b')
+    storeFile.write(_packHeader(header))
+    storeFile.close()
+
+
+def storeToVectors(store: dict):
+    """
+    Transforming a loaded feature store to list of [time, [features]],
+    which is the format of feature vectors in JSON file and searchtree.
+    """
+    times = store['times'].tolist()
+    featureMatrix = store['features'].tolist()
+    featureVectors = []
+    for i in range(0, len(times)):
+        featureVectors.append([times[i], featureMatrix[i]])
+    return featureVectors
+
+
+def timeSpans(store: dict):
+    """
+    Time span covered by each feature vector of a loaded feature store.
+    ================================================================
+    Output Format: array[count][2] of [start, end) in seconds
+    A frame covers the time until the next stored frame, which is exact
+    for adaptive sampling and (nSkip + 1) frames for fixed sampling.
+    The last frame ends at endTime of header, if it is known.
+    """
+    header = store['header']
+    times = np.asarray(store['times'], dtype=np.float64)
+    spans = np.zeros((len(times), 2))
+    if (len(times) == 0):
+        return spans
+    spans[:, 0] = times
+    spans[0:-1, 1] = times[1:]
+    if (header.get('endTime') is not None):
+        spans[-1, 1] = header['endTime']
+    elif (header.get('fps')):
+        step = (header.get('nSkip') or 0) + 1
+        spans[-1, 1] = times[-1] + step / header['fps']
+    else:
+        spans[-1, 1] = times[-1]
+    return spans
+
+
+def rowsToVectors(store: dict, rows, distances=None):
+    """
+    Transforming some rows of a loaded feature store to list of
+    [time, [features]], or [time, [features], distance] if distances of
+    the rows are given, e.g. results of nearest search.
+    """
+    featureVectors = storeToVectors(
+        {'times': np.asarray(store['times'][rows]),
+         'features': np.asarray(store['features'][rows], dtype=np.int64)})
+    if (distances is not None):
+        distances = np.asarray(distances).tolist()
+        for i in range(0, len(featureVectors)):
+            featureVectors[i].append(distances[i])
+    return featureVectors
+
+
+def convertJson(jsonPath: str, storePath: str, fps: float = 0.0):
+    """
+    Converting feature vectors in JSON to a binary feature store.
+    ================================================================
+    Grid size and source video are read from the file name,
+    e.g. "sample.mp4.2x8.json". fps is unknown in JSON, 0 by default.
+    Output: number of feature vectors converted
+    """
+    store = _loadJson(jsonPath)
+    header = store['header']
+    if (header['rows'] == 0):
+        raise ValueError('Grid size is not found in file name: ' + jsonPath)
+    frameFeatures = zip(store['times'].tolist(), store['features'].tolist())
+    return writeStore(
+        storePath, frameFeatures, fps, header['rows'], header['cols'],
+        header['dimension'], header['source'])
+
+
+def isStore(path: str):
+    # Return true if the file is a binary feature store
+    storeFile = open(path, 'rb')
+    magic = storeFile.read(len(MAGIC))
+    storeFile.close()
+    return magic == MAGIC
+
+
+##############################################################################
+# ----------Functions for internal uses: Header and JSON----------
+##############################################################################
+
+
+def _featureType(dimensionOriginal: int):
+    # DCT coefficient of averages (0 - 255) is bounded by 255 * sqrt(2n).
+    # int16 is used if it is enough, otherwise int32.
+    if (255 * (2 * dimensionOriginal) ** 0.5 < 32767):
+        return '<i2'
+    return '<i4'
+
+
+def _rowWidth(header: dict):
+    # Number of features in a row, for all levels of a pyramid
+    return header['dimension'] * len(header.get('levels') or [None])
+
+
+def _alignedOffset(offset: int):
+    # Round up to multiple of 8 bytes for memory-mapping float64
+    return (offset + 7) // 8 * 8
+
+
+def _packHeader(header: dict):
+    text = json.dumps(header).encode('utf-8')
+    if (len(MAGIC) + len(text) > HEADER_SIZE):
+        raise ValueError('Header of feature store is too long.')
+    return MAGIC + text.ljust(HEADER_SIZE - len(MAGIC), b' ')
+
+
+def _writeRows(storeFile, rows: list, width: int, dtype: str):
+    matrix = np.asarray(rows, dtype=np.int64).reshape(-1, width)
+    storeFile.write(matrix.astype(dtype).tobytes())
+
+
+def _writeChunk(storeFile, checkpointFile, times, chunk: list,
+                width: int, dtype: str):
+    # Feature vectors are flushed before their timestamps are saved
+    with metrics.stage('write'):
+        _writeRows(storeFile, [v[1] for v in chunk], width, dtype)
+        chunkTimes = [v[0] for v in chunk]
+        times.extend(chunkTimes)
+        if (checkpointFile is not None):
+            storeFile.flush()
+            checkpointFile.write(
+                np.asarray(chunkTimes, dtype='<f8').tobytes())
+            checkpointFile.flush()
+
+
+def _finishStore(storeFile, header: dict, times):
+    # Timestamp column is written after the feature matrix
+    header['count'] = len(times)
+    header['timesOffset'] = _alignedOffset(storeFile.tell())
+    storeFile.write(b'\0' * (header['timesOffset'] - storeFile.tell()))
+    storeFile.write(np.asarray(times, dtype='<f8').tobytes())
+    storeFile.truncate()
+    storeFile.seek(0)
+    storeFile.write(_packHeader(header))
+
+
+def _loadJson(path: str):
+    # Feature vectors in JSON: [[time, [features]], ...]
+    # File name is in format of "<source>.<rows>x<cols>.json"
+    featuresFile = open(path, 'r')
+    featureVectors = json.loads(featuresFile.read())
+    featuresFile.close()
+
+    nameParts = os.path.basename(path).split('.')
+    rows, cols = 0, 0
+    if (len(nameParts) >= 3 and 'x' in nameParts[-2]):
+        grid = nameParts[-2].split('x')
+        if (grid[0].isdigit() and grid[1].isdigit()):
+            rows, cols = int(grid[0]), int(grid[1])
+    dimension = 16
+    if (len(featureVectors) > 0):
+        dimension = len(featureVectors[0][1])
+
+    times = np.array([v[0] for v in featureVectors], dtype=np.float64)
+    featureMatrix = np.array(
+        [v[1] for v in featureVectors], dtype=np.int64
+    ).reshape(-1, dimension)
+    header = {
+        'fps': 0.0,
+        'rows': rows,
+        'cols': cols,
+        'dimension': dimension,
+        'source': '.'.join(nameParts[:-2]),
+        'nSkip': None,
+        'count': len(featureVectors),
+        'endTime': None,
+        'sampling': None
+    }
+    return {'header': header, 'times': times, 'features': featureMatrix}
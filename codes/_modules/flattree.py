@@ -0,0 +1,528 @@
+"""
+This module is for searching with a compact representation of Octree.
+Instead of nested lists in searchtree, the tree is stored in flat arrays,
+and leaves refer to rows of the feature matrix of a feature store.
+Only the top-3 features are used for indexing, same as searchtree.
+"""
+
+import time
+import heapq
+import numpy as np
+from _modules import featurestore
+from _modules import metrics
+from _modules import searchtree
+
+# Flat Tree Format: dict of numpy arrays
+#   'bounds':     array[node][6] = [xLow, yLow, zLow, xHigh, yHigh, zHigh]
+#   'firstChild': array[node] = index of 1st of 8 contiguous sub-nodes,
+#                               or -1 for leaf
+#   'leafStart':  array[node] = start of leaf in 'rows'
+#   'leafEnd':    array[node] = end of leaf in 'rows' (exclusive)
+#   'rows':       array[point] = row index of feature matrix,
+#                               rows of a leaf are contiguous
+#   'maxChild':   array[1] = maxChild
+#   'root':       array[1] = index of root node
+# Sub-nodes are ordered as 000, 001, ..., 111, same as searchtree.
+MAX_DEPTH = 32
+# Rows of a leaf scanned between checks of the time budget of a search
+LEAF_CHUNK = 1024
+
+##############################################################################
+# ----------Functions for external scripts: indexing() and searching()--------
+##############################################################################
+
+
+@metrics.timed('build')
+def indexing(store: dict, maxChild: int, maxDepth: int = MAX_DEPTH):
+    """
+    Building flat index tree of feature vectors in a feature store.
+    ================================================================
+    Output Format: flat tree, see above.
+    The tree is bulk-loaded from top to bottom: all points in a level are
+    assigned to sub-nodes together by vectorized operations, instead of
+    inserting points one by one as searchtree.indexing().
+    Same as searchtree, a node is splited if it has maxChild points or
+    more. Splitting stops at maxDepth, or if all points in a node have
+    the same coordination, so identical frames do not cause deep splits.
+    """
+    coordination = np.asarray(store['features'][:, 0:3], dtype=np.float64)
+    nPoint = len(coordination)
+
+    # Building root node, with boundary of all points
+    bounds = [np.concatenate(_intialBroundary(coordination))[np.newaxis]]
+    firstChild = [np.array([-1])]
+    nNode = 1
+
+    # pointNode[i] = node of i-th point, active = points in nodes of a level
+    # Nodes of a level are contiguous: level = [levelStart, nNode)
+    pointNode = np.zeros(nPoint, dtype=np.int64)
+    active = np.arange(nPoint)
+    levelStart = 0
+    depth = 0
+    while (len(active) > 0 and depth < maxDepth):
+
+        # Decide which nodes in this level are splited
+        levelSize = nNode - levelStart
+        levelOf = pointNode[active] - levelStart
+        counts = np.bincount(levelOf, minlength=levelSize)
+        low = np.full((levelSize, 3), np.inf)
+        high = np.full((levelSize, 3), -np.inf)
+        np.minimum.at(low, levelOf, coordination[active])
+        np.maximum.at(high, levelOf, coordination[active])
+        toSplit = (counts >= maxChild) & np.any(high > low, axis=1)
+        if (not np.any(toSplit)):
+            break
+
+        # Create 8 sub-nodes for each splited node, see _subBroundarys()
+        splitNodes = levelStart + np.flatnonzero(toSplit)
+        nodeBounds = np.concatenate(bounds)
+        nodeFirstChild = np.concatenate(
+            firstChild + [np.full(8 * len(splitNodes), -1)])
+        nodeFirstChild[splitNodes] = nNode + 8 * np.arange(len(splitNodes))
+        bounds = [nodeBounds, _subBroundarys(nodeBounds[splitNodes])]
+        firstChild = [nodeFirstChild]
+        levelStart, nNode = nNode, nNode + 8 * len(splitNodes)
+        metrics.count('splits', len(splitNodes))
+
+        # Assign points of splited nodes to sub-nodes.
+        # Point on the middle plane goes to the lower sub-node,
+        # same as the order of comparison in searchtree.
+        active = active[toSplit[levelOf]]
+        nodes = pointNode[active]
+        middle = (nodeBounds[nodes, 0:3] + nodeBounds[nodes, 3:6]) / 2
+        octant = coordination[active] > middle
+        pointNode[active] = (
+            nodeFirstChild[nodes] +
+            octant[:, 0] * 4 + octant[:, 1] * 2 + octant[:, 2])
+        depth += 1
+    metrics.maximum('maxDepth', depth)
+
+    # Points of a leaf are stored contiguously in 'rows'
+    bounds = np.concatenate(bounds)
+    firstChild = np.concatenate(firstChild)
+    rows = np.argsort(pointNode, kind='stable')
+    leafSize = np.bincount(pointNode, minlength=nNode)
+    leafEnd = np.cumsum(leafSize)
+    leafStart = leafEnd - leafSize
+    leafStart[firstChild >= 0] = 0
+    leafEnd[firstChild >= 0] = 0
+    return {
+        'bounds': bounds,
+        'firstChild': firstChild.astype(np.int64),
+        'leafStart': leafStart.astype(np.int64),
+        'leafEnd': leafEnd.astype(np.int64),
+        'rows': rows.astype(np.int64),
+        'maxChild': np.array([maxChild], dtype=np.int64),
+        'root': np.array([0], dtype=np.int64)
+    }
+
+
+@metrics.timed('build')
+def appending(flatTree: dict, store: dict, firstRow: int, maxChild: int):
+    """
+    Adding rows appended to a feature store into its flat tree.
+    ================================================================
+    Output: flat tree, or None if it should be rebuilt by indexing()
+    Rows from firstRow onwards are assigned to existing leaves, and no
+    node is splited, so the tree is updated without sorting all points.
+    If a new row is outside broundary of the root, the root grows until
+    it is inside, see _growBroundary().
+    The tree should be rebuilt if the root cannot grow, or a leaf grows
+    beyond 2 * maxChild while its points are not all at the same
+    coordination, since searching it would be slow.
+    """
+    bounds = flatTree['bounds']
+    firstChild = flatTree['firstChild']
+    leafSize = flatTree['leafEnd'] - flatTree['leafStart']
+    root = int(flatTree['root'][0])
+    coordination = np.asarray(
+        store['features'][firstRow:, 0:3], dtype=np.float64)
+    outside = (np.any(coordination < bounds[root, 0:3], axis=1) |
+               np.any(coordination > bounds[root, 3:6], axis=1))
+    if (np.any(outside) and firstChild[root] < 0):
+        # Broundary of a leaf is only used for distance, so it is extended
+        bounds = bounds.copy()
+        bounds[root, 0:3] = np.minimum(
+            bounds[root, 0:3], coordination.min(axis=0))
+        bounds[root, 3:6] = np.maximum(
+            bounds[root, 3:6], coordination.max(axis=0))
+    elif (np.any(outside)):
+        grown = _growBroundary(
+            bounds, firstChild, root, coordination[outside])
+        if (grown is None):
+            return None
+        bounds, firstChild = grown
+        leafSize = np.concatenate(
+            [leafSize, np.zeros(len(firstChild) - len(leafSize), np.int64)])
+
+    # Find leaf of each new row, same assignment as indexing()
+    pointNode = np.full(len(coordination), root, dtype=np.int64)
+    inner = np.flatnonzero(firstChild[pointNode] >= 0)
+    while (len(inner) > 0):
+        nodes = pointNode[inner]
+        middle = (bounds[nodes, 0:3] + bounds[nodes, 3:6]) / 2
+        octant = coordination[inner] > middle
+        pointNode[inner] = (
+            firstChild[nodes] +
+            octant[:, 0] * 4 + octant[:, 1] * 2 + octant[:, 2])
+        inner = inner[firstChild[pointNode[inner]] >= 0]
+
+    # Old rows are ordered by leaf, new rows are placed after them
+    oldNode = np.repeat(np.arange(len(firstChild)), leafSize)
+    allNode = np.concatenate([oldNode, pointNode])
+    order = np.argsort(allNode, kind='stable')
+    rows = np.concatenate([
+        flatTree['rows'],
+        np.arange(firstRow, firstRow + len(coordination))])[order]
+    leafSize = np.bincount(allNode, minlength=len(firstChild))
+    leafEnd = np.cumsum(leafSize)
+    leafStart = leafEnd - leafSize
+    leafStart[firstChild >= 0] = 0
+    leafEnd[firstChild >= 0] = 0
+
+    for node in np.unique(pointNode):
+        if (leafSize[node] > 2 * maxChild):
+            leafPoints = np.asarray(
+                store['features'][rows[leafStart[node]:leafEnd[node]], 0:3])
+            if (np.any(leafPoints.max(axis=0) > leafPoints.min(axis=0))):
+                return None
+    return {
+        'bounds': bounds,
+        'firstChild': firstChild,
+        'leafStart': leafStart.astype(np.int64),
+        'leafEnd': leafEnd.astype(np.int64),
+        'rows': rows.astype(np.int64),
+        'maxChild': np.array([maxChild], dtype=np.int64),
+        'root': flatTree['root']
+    }
+
+
+@metrics.timed('query')
+def searching(flatTree: dict, store: dict, features: list, counter=0,
+              similarThreshold: float = 32, exactThreshold: float = 1):
+    """
+    Searching in flat index tree of feature vectors.
+    ================================================================
+    Output Format: (exactMatch, similarMatch, counter) where
+        exactMatch: list of feature vectors in format [time, [features]]
+        similarMatch: list of feature vectors in format [time, [features]]
+        counter: number of comparison
+    Results are the same as searchtree.searching(), thresholds as well.
+    For all frames within a distance, see radiusSearching().
+    """
+    bounds = flatTree['bounds']
+    firstChild = flatTree['firstChild']
+    node = int(flatTree['root'][0])
+
+    # Search in intermediate node
+    # In worst case, 8 comparison are needed.
+    while (firstChild[node] >= 0):
+        location = -1
+        for i in range(0, 8):
+            counter += 1
+            if (searchtree._compareBroundary(
+                    bounds[firstChild[node] + i], features[0:3])):
+                location = firstChild[node] + i
+                break
+        if (location < 0):
+            # features is out of broundary of the tree
+            return [], [], counter
+        metrics.count('nodesVisited')
+        node = location
+
+    # Search in leaf node
+    # In worst case, maxChild of comparisons are needed.
+    rows = flatTree['rows'][flatTree['leafStart'][node]:
+                            flatTree['leafEnd'][node]]
+    counter += len(rows)
+    metrics.count('leafScans')
+    leafFeatures = np.asarray(store['features'][rows], dtype=np.int64)
+    leafTimes = np.asarray(store['times'][rows])
+
+    difference = (leafFeatures - np.asarray(features)) ** 2
+    lowerBound = np.sqrt(difference[:, 0:3].sum(axis=1)) // 3
+    actual = np.sqrt(difference.sum(axis=1)) / difference.shape[1]
+    similar = lowerBound < similarThreshold
+    exact = similar & (actual < exactThreshold)
+    exactMatch = featurestore.storeToVectors(
+        {'times': leafTimes[exact], 'features': leafFeatures[exact]})
+    similarMatch = featurestore.storeToVectors(
+        {'times': leafTimes[similar], 'features': leafFeatures[similar]})
+    return exactMatch, similarMatch, counter
+
+
+@metrics.timed('query')
+def knnSearching(flatTree: dict, store: dict, features: list, k: int,
+                 counter=0):
+    """
+    Searching k nearest feature vectors in flat index tree.
+    ================================================================
+    Output Format: (nearestMatch, counter) where
+        nearestMatch: list of [time, [features], distance], sorted by
+                      distance among all dimensions of features
+        counter: number of comparison
+    Distance is in the same scale as searchtree._distanceActual().
+    Nodes are visited best-first by the distance from features to their
+    broundary, which is a lower bound of distance to any point inside.
+    Search stops when no node can be closer than the k-th nearest found,
+    so results are exact as brute-force search.
+    """
+    if (k < 1):
+        raise ValueError('Number of nearest results must be at least 1.')
+    query = np.asarray(features, dtype=np.int64)
+    rows, distances, counter, exact = _bestFirst(
+        flatTree, store, query, k, None, None, None, counter)
+    return featurestore.rowsToVectors(
+        store, rows, distances / len(query)), counter
+
+
+@metrics.timed('query')
+def budgetSearching(flatTree: dict, store: dict, features: list, k: int,
+                    maxComparisons: int = None, seconds: float = None,
+                    counter=0):
+    """
+    Searching k nearest feature vectors within a budget.
+    ================================================================
+    Output Format: (nearestMatch, counter, exact) where
+        nearestMatch, counter: same as knnSearching()
+        exact: true if results are the same as knnSearching()
+    Same as knnSearching(), but search stops before more than
+    maxComparisons of comparisons are performed, counted from counter,
+    or when seconds are passed, and the nearest found so far are
+    returned. A leaf is scanned only in part if the budget runs out in
+    it. Closer nodes are visited first, so the results are usually good
+    even if they are not exact.
+    """
+    if (k < 1):
+        raise ValueError('Number of nearest results must be at least 1.')
+    query = np.asarray(features, dtype=np.int64)
+    deadline = None if seconds is None else time.perf_counter() + seconds
+    rows, distances, counter, exact = _bestFirst(
+        flatTree, store, query, k, None, maxComparisons, deadline, counter)
+    return featurestore.rowsToVectors(
+        store, rows, distances / len(query)), counter, exact
+
+
+@metrics.timed('query')
+def radiusSearching(flatTree: dict, store: dict, features: list,
+                    radius: float, maxComparisons: int = None,
+                    seconds: float = None, counter=0):
+    """
+    Searching all feature vectors within a distance of features.
+    ================================================================
+    Output Format: (radiusMatch, counter, exact) where
+        radiusMatch: list of [time, [features], distance] with
+                     distance <= radius, sorted by distance
+        counter, exact: same as budgetSearching()
+    Distance is in the same scale as knnSearching(), e.g. radius = 1 is
+    the exact match of searching(). Only nodes with broundary within
+    radius are visited.
+    """
+    query = np.asarray(features, dtype=np.int64)
+    deadline = None if seconds is None else time.perf_counter() + seconds
+    rows, distances, counter, exact = _bestFirst(
+        flatTree, store, query, None, radius * len(query),
+        maxComparisons, deadline, counter)
+    return featurestore.rowsToVectors(
+        store, rows, distances / len(query)), counter, exact
+
+
+def flatten(tree: list, featureVectors: list):
+    """
+    Transforming index tree of searchtree.indexing() to flat tree.
+    ================================================================
+    featureVectors must be the list used for building the tree, so that
+    each [time, [features]] in leaves can be mapped to its row index.
+    """
+    rowOf = {}
+    for i in range(0, len(featureVectors)):
+        rowOf[id(featureVectors[i])] = i
+
+    bounds = [tree[0][1:7]]
+    firstChild = [-1]
+    leafStart = [0]
+    leafEnd = [0]
+    rows = []
+    maxChild = tree[0][7]
+
+    # Breadth-first traversal, so that sub-nodes of a node are contiguous
+    queue = [(tree, 0)]
+    head = 0
+    while (head < len(queue)):
+        subtree, node = queue[head]
+        head += 1
+        if (subtree[0][0]):
+            # Header of intermediate node has maxChild = 8, but not leaf
+            maxChild = subtree[0][7]
+            leafStart[node] = len(rows)
+            for i in range(1, len(subtree)):
+                rows.append(rowOf[id(subtree[i])])
+            leafEnd[node] = len(rows)
+        else:
+            firstChild[node] = len(bounds)
+            for i in range(1, 9):
+                queue.append((subtree[i], len(bounds)))
+                bounds.append(subtree[i][0][1:7])
+                firstChild.append(-1)
+                leafStart.append(0)
+                leafEnd.append(0)
+
+    return {
+        'bounds': np.array(bounds, dtype=np.float64),
+        'firstChild': np.array(firstChild, dtype=np.int64),
+        'leafStart': np.array(leafStart, dtype=np.int64),
+        'leafEnd': np.array(leafEnd, dtype=np.int64),
+        'rows': np.array(rows, dtype=np.int64),
+        'maxChild': np.array([maxChild], dtype=np.int64),
+        'root': np.array([0], dtype=np.int64)
+    }
+
+
+##############################################################################
+# ----------Functions for internal uses: Determine Coordination----------
+##############################################################################
+
+
+def _intialBroundary(coordination):
+    # Same as searchtree._intialBroundary(), for array[point][3]
+    # Intial broundary in [Min(x), Min(y), Min(z)], [Max(x), Max(y), Max(z)]
+    if (len(coordination) == 0):
+        return np.zeros(3), np.zeros(3)
+    return coordination.min(axis=0), coordination.max(axis=0)
+
+
+def _subBroundarys(inputBroundarys):
+    # Same as searchtree._subBroundarys(), for array[node][6]
+    # Output: array[node * 8][6], sub-nodes of a node are contiguous
+    low = inputBroundarys[:, np.newaxis, 0:3]
+    high = inputBroundarys[:, np.newaxis, 3:6]
+    middle = (low + high) / 2
+    octant = np.array(
+        [[(i >> 2) & 1, (i >> 1) & 1, i & 1] for i in range(0, 8)]) == 1
+    outputBoundarys = np.concatenate([
+        np.where(octant, middle, low),
+        np.where(octant, high, middle)], axis=2)
+    return outputBoundarys.reshape(-1, 6)
+
+
+def _growBroundary(bounds, firstChild, root: int, coordination):
+    # Root is grown towards coordination, array[point][3] outside of its
+    # broundary, until all of them are inside. Each time, broundary is
+    # doubled towards the first point outside, so that the old root is
+    # one of 8 sub-nodes of a new root, which takes the index of root.
+    # Output: (bounds, firstChild), or None if a side of the root has
+    # zero length, which cannot be doubled.
+    # Features are integers, so on an axis grown downwards the middle
+    # is half a unit below the old root. No point is on the middle, which
+    # would go to the lower sub-node, away from the old root.
+    while (True):
+        low, high = bounds[root, 0:3], bounds[root, 3:6]
+        outside = (np.any(coordination < low, axis=1) |
+                   np.any(coordination > high, axis=1))
+        if (not np.any(outside)):
+            return bounds, firstChild
+        if (np.any(high <= low)):
+            return None
+        below = coordination[np.argmax(outside)] < low
+        newBroundary = np.concatenate([
+            np.where(below, 2 * (low - 0.5) - high, low),
+            np.where(below, high, 2 * high - low)])
+        location = int(below[0]) * 4 + int(below[1]) * 2 + int(below[2])
+
+        # Old root is moved to its sub-node, then root is the new root
+        subBroundarys = _subBroundarys(newBroundary[np.newaxis])
+        subBroundarys[location] = bounds[root]
+        subFirstChild = np.full(8, -1, dtype=np.int64)
+        subFirstChild[location] = firstChild[root]
+        bounds = np.concatenate([bounds, subBroundarys])
+        firstChild = np.concatenate([firstChild, subFirstChild])
+        bounds[root] = newBroundary
+        firstChild[root] = len(firstChild) - 8
+        metrics.count('rootGrowths')
+
+
+def _bestFirst(flatTree: dict, store: dict, query, k: int, radius: float,
+               maxComparisons: int, deadline: float, counter: int):
+    # Best-first search for k nearest, or for all within radius if k is
+    # None. Output: (rows, distances, counter, exact), sorted by distance,
+    # where distances are not divided by dimension.
+    bounds = flatTree['bounds']
+    firstChild = flatTree['firstChild']
+    leafStart = flatTree['leafStart']
+    leafEnd = flatTree['leafEnd']
+
+    # bestRows & bestDistances = nearest found so far, not sorted
+    bestRows = np.zeros(0, dtype=np.int64)
+    bestDistances = np.zeros(0)
+    heap = [(0.0, int(flatTree['root'][0]))]
+    exact = True
+    while (len(heap) > 0):
+        lowerBound, node = heapq.heappop(heap)
+        if (k is not None and len(bestRows) >= k and
+                lowerBound > bestDistances.max()):
+            break
+        if (radius is not None and lowerBound > radius):
+            break
+        if ((maxComparisons is not None and counter >= maxComparisons) or
+                (deadline is not None and time.perf_counter() > deadline)):
+            # Budget runs out, a node which may be closer is not visited
+            exact = False
+            break
+        metrics.count('nodesVisited')
+        if (firstChild[node] >= 0):
+            # Search in intermediate node: 8 comparison for sub-nodes
+            if (maxComparisons is not None and
+                    counter + 8 > maxComparisons):
+                exact = False
+                break
+            children = firstChild[node] + np.arange(8)
+            counter += 8
+            childBounds = _boxDistance(bounds[children], query[0:3])
+            for i in range(0, 8):
+                if (firstChild[children[i]] >= 0 or
+                        leafEnd[children[i]] > leafStart[children[i]]):
+                    heapq.heappush(
+                        heap, (float(childBounds[i]), int(children[i])))
+        else:
+            # Search in leaf node: 1 comparison for each point.
+            # A leaf of identical points may be large, so it is only
+            # scanned within the budget, and in chunks of LEAF_CHUNK.
+            metrics.count('leafScans')
+            leafRows = flatTree['rows'][leafStart[node]:leafEnd[node]]
+            if (maxComparisons is not None and
+                    len(leafRows) > maxComparisons - counter):
+                leafRows = leafRows[0:maxComparisons - counter]
+                exact = False
+            for start in range(0, len(leafRows), LEAF_CHUNK):
+                if (start > 0 and deadline is not None and
+                        time.perf_counter() > deadline):
+                    exact = False
+                    break
+                rows = leafRows[start:start + LEAF_CHUNK]
+                counter += len(rows)
+                leafFeatures = np.asarray(store['features'][rows], np.int64)
+                distances = np.sqrt(
+                    ((leafFeatures - query) ** 2).sum(axis=1))
+                if (radius is not None):
+                    inside = distances <= radius
+                    rows, distances = rows[inside], distances[inside]
+                bestRows = np.concatenate([bestRows, rows])
+                bestDistances = np.concatenate([bestDistances, distances])
+                if (k is not None and len(bestRows) > k):
+                    keep = np.argpartition(bestDistances, k - 1)[0:k]
+                    bestRows = bestRows[keep]
+                    bestDistances = bestDistances[keep]
+
+    # Sorted by distance, then by time for equal distances
+    order = np.lexsort((bestRows, bestDistances))
+    return bestRows[order], bestDistances[order], counter, exact
+
+
+def _boxDistance(inputBroundarys, coordination):
+    # Distance from coordination to each broundary in array[node][6].
+    # It is 0 if coordination is inside the broundary.
+    below = inputBroundarys[:, 0:3] - coordination
+    above = coordination - inputBroundarys[:, 3:6]
+    gap = np.maximum(np.maximum(below, above), 0)
+    return np.sqrt((gap ** 2).sum(axis=1))
+
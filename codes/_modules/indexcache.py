@@ -0,0 +1,123 @@
+"""
+This module is for keeping feature vectors and index trees of many videos
+in memory, so that repeated searches do not reload them from disk.
+Least recently used videos are evicted when the memory budget is exceeded.
+"""
+
+import threading
+import collections
+import numpy as np
+from _modules import featurestore
+from _modules import flattree
+from _modules import indexstore
+
+
+class IndexCache:
+    """
+    LRU cache of {featuresPath: (store, tree)} under a memory budget.
+    ================================================================
+    store: loaded by featurestore.loadStore(), arrays are read into memory
+    tree: flat tree of indexstore.loadOrIndexing()
+    Counters of hits, misses and evictions are available from stats().
+    Safe to be used by multiple threads.
+    """
+
+    def __init__(self, budgetBytes: int):
+        self.budgetBytes = budgetBytes
+        self.usedBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, featuresPath: str, rows: int = None, cols: int = None):
+        """
+        Output Format: (store, tree) of a feature file, loaded if needed.
+        rows & cols select a level of a feature pyramid, see
+        featurestore.levelStore(), None for the grid of the file. A level
+        is indexed in memory when it is first searched, and cached as an
+        entry of its own. Output is (None, None) if it is not stored.
+        """
+        store, tree = self._get(featuresPath, None)
+        header = store['header']
+        if (rows is None or (rows, cols) == (header['rows'], header['cols'])):
+            return store, tree
+        levelStore = featurestore.levelStore(store, rows, cols)
+        if (levelStore is None):
+            return None, None
+        return self._get(f'{featuresPath}#{rows}x{cols}', levelStore)
+
+    def _get(self, key: str, levelStore: dict):
+        # Entry of a feature file, or of a level if levelStore is given
+        with self._lock:
+            if (key in self._entries):
+                self.hits += 1
+                self._entries.move_to_end(key)
+                store, tree, size = self._entries[key]
+                return store, tree
+            self.misses += 1
+
+        # Loading is done without lock, so hits of other videos are not
+        # blocked. Two threads may load the same video, the later one wins.
+        if (levelStore is None):
+            store, tree = _loadEntry(key)
+            size = _entrySize(store, tree)
+        else:
+            # Arrays of a level are shared with its feature file
+            store = levelStore
+            tree = flattree.indexing(
+                store, max(1, int(len(store['times']) ** 0.5)))
+            size = sum(tree[name].nbytes for name in tree)
+        with self._lock:
+            if (key in self._entries):
+                self.usedBytes -= self._entries.pop(key)[2]
+            self._entries[key] = (store, tree, size)
+            self.usedBytes += size
+
+            # Evict least recently used videos, except the new one
+            while (self.usedBytes > self.budgetBytes and
+                    len(self._entries) > 1):
+                evictedPath, evicted = self._entries.popitem(last=False)
+                self.usedBytes -= evicted[2]
+                self.evictions += 1
+        return store, tree
+
+    def stats(self):
+        """
+        Output Format: dict of counters and memory usage.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'videos': list(self._entries.keys()),
+                'usedBytes': self.usedBytes,
+                'budgetBytes': self.budgetBytes
+            }
+
+
+def _loadEntry(featuresPath: str):
+    # Read feature store into memory, then load or build its index
+    loadedStore = featurestore.loadStore(featuresPath)
+    store = {
+        'header': loadedStore['header'],
+        'times': np.array(loadedStore['times']),
+        'features': np.array(loadedStore['features'])
+    }
+    if ('levels' in loadedStore):
+        store['levels'] = {key: np.array(level) for key, level
+                           in loadedStore['levels'].items()}
+    tree, treeLoaded = indexstore.loadOrIndexing(featuresPath, store)
+    return store, tree
+
+
+def _entrySize(store: dict, tree: dict):
+    # Memory usage of arrays in store and tree, in bytes
+    size = store['times'].nbytes + store['features'].nbytes
+    for level in store.get('levels', {}).values():
+        size += level.nbytes
+    for key in tree:
+        size += tree[key].nbytes
+    return size
@@ -0,0 +1,148 @@
+"""
+This module is for saving and loading index tree on disk.
+A saved index is only reused if it is built from the same feature vectors
+with the same parameters, otherwise it should be rebuilded.
+"""
+
+import os
+import json
+import zipfile
+import tempfile
+import numpy as np
+from _modules import flattree
+
+EXTENSION = '.index'
+VERSION = 2
+
+##############################################################################
+# ----------Functions for external scripts: saveIndex() and loadIndex()------
+##############################################################################
+
+
+def indexPath(featuresPath: str):
+    """
+    Path of saved index for a feature file,
+    e.g. "output/sample.mp4.2x8.feat" ---> "output/index_sample.mp4.2x8.index"
+    """
+    folder, name = os.path.split(featuresPath)
+    return os.path.join(
+        folder, 'index_' + os.path.splitext(name)[0] + EXTENSION)
+
+
+def loadOrIndexing(featuresPath: str, store: dict):
+    """
+    Loading saved flat tree of a feature file, or building and saving it
+    if it is missing or stale.
+    ================================================================
+    Output Format: (tree, loaded) where
+        tree: flat tree of flattree.indexing()
+        loaded: true if the saved index is reused
+    """
+    maxChild = max(1, int((len(store['times']) ** 0.5)))
+    path = indexPath(featuresPath)
+    signature = indexSignature(
+        featuresPath, maxChild,
+        store['header']['rows'], store['header']['cols'])
+    tree = loadIndex(path, signature)
+    if (tree is not None):
+        return tree, True
+    tree = flattree.indexing(store, maxChild)
+    saveIndex(path, tree, signature)
+    return tree, False
+
+
+def appendOrIndexing(featuresPath: str, store: dict, oldSignature: dict,
+                     firstRow: int):
+    """
+    Updating saved flat tree after feature vectors are appended to a
+    feature file, e.g. by featurestore.appendStore().
+    ================================================================
+    Output Format: (tree, appended) where
+        tree: flat tree of the whole feature file
+        appended: true if rows from firstRow onwards are added into the
+                  saved index by flattree.appending(), false if the
+                  index is rebuilt
+    oldSignature is indexSignature() of the feature file before rows are
+    appended, so a saved index of other feature vectors is not updated.
+    """
+    maxChild = max(1, int((len(store['times']) ** 0.5)))
+    path = indexPath(featuresPath)
+    signature = indexSignature(
+        featuresPath, maxChild,
+        store['header']['rows'], store['header']['cols'])
+    tree = loadIndex(path, oldSignature)
+    if (tree is not None):
+        tree = flattree.appending(tree, store, firstRow, maxChild)
+    appended = tree is not None
+    if (not appended):
+        tree = flattree.indexing(store, maxChild)
+    saveIndex(path, tree, signature)
+    return tree, appended
+
+
+def indexSignature(featuresPath: str, maxChild: int, rows: int, cols: int):
+    """
+    Signature of an index, for checking whether a saved index is stale.
+    ================================================================
+    Output Format: dict of {version, size, mtime, maxChild, rows, cols}
+    where size and mtime are read from the feature file.
+    """
+    status = os.stat(featuresPath)
+    return {
+        'version': VERSION,
+        'size': status.st_size,
+        'mtime': status.st_mtime_ns,
+        'maxChild': maxChild,
+        'rows': rows,
+        'cols': cols
+    }
+
+
+def saveIndex(path: str, tree, signature: dict):
+    """
+    Saving flat tree of flattree with its signature.
+    ================================================================
+    Arrays are saved by numpy.savez into a temporary file, which then
+    replaces the index, so a reader never sees a partly written index
+    even if several threads or processes save it at the same time.
+    """
+    descriptor, temporaryPath = tempfile.mkstemp(
+        suffix='.tmp', dir=os.path.dirname(path) or '.')
+    indexFile = os.fdopen(descriptor, 'wb')
+    try:
+        np.savez(indexFile, signature=json.dumps(signature), **tree)
+        indexFile.close()
+        os.replace(temporaryPath, path)
+    except BaseException:
+        indexFile.close()
+        os.remove(temporaryPath)
+        raise
+
+
+def loadIndex(path: str, signature: dict):
+    """
+    Loading flat tree if it is valid.
+    ================================================================
+    Output: flat tree, or None if it is missing, stale or unreadable.
+    Only arrays saved by saveIndex() are read, files of other formats,
+    e.g. older versions, are treated as stale.
+    """
+    if (not os.path.exists(path) or not zipfile.is_zipfile(path)):
+        return None
+    return _loadArrays(path, signature)
+
+
+def _loadArrays(path: str, signature: dict):
+    # Load flat tree saved by numpy.savez
+    try:
+        arrays = np.load(path, allow_pickle=False)
+        if (json.loads(str(arrays['signature'])) != signature):
+            return None
+        tree = {}
+        for key in arrays.files:
+            if (key != 'signature'):
+                tree[key] = arrays[key]
+        arrays.close()
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+    return tree
@@ -0,0 +1,319 @@
+"""
+This module is for ingesting many videos in one run without prompts.
+Videos are extracted by a pool of processes, one video per process,
+longest first, so a long video is not left running alone at the end.
+Each feature store is indexed as soon as its video is done.
+"""
+
+import os
+import time
+import hashlib
+import concurrent.futures
+import cv2
+from _modules import extraction
+from _modules import featurecache
+from _modules import featurestore
+from _modules import indexstore
+from _modules import metrics
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.webm', '.m4v',
+                    '.mpg', '.mpeg', '.flv', '.wmv')
+
+##############################################################################
+# ----------Functions for external scripts: videoPaths() and ingesting()-----
+##############################################################################
+
+
+def videoPaths(sources: list):
+    """
+    Paths of videos in folders and manifest files.
+    ================================================================
+    Output: list of paths, without duplicates, in order of sources
+    A folder gives its files with VIDEO_EXTENSIONS, sorted by name.
+    A manifest is a text file of one path per line, relative to the
+    manifest. Empty lines and lines starting with "#" are ignored.
+    """
+    paths = []
+    for source in sources:
+        if (os.path.isdir(source)):
+            for name in sorted(os.listdir(source)):
+                if (name.lower().endswith(VIDEO_EXTENSIONS)):
+                    paths.append(os.path.join(source, name))
+        else:
+            manifestFile = open(source, 'r')
+            for line in manifestFile:
+                line = line.strip()
+                if (line != '' and not line.startswith('#')):
+                    paths.append(os.path.join(os.path.dirname(source), line))
+            manifestFile.close()
+    return list(dict.fromkeys(os.path.normpath(path) for path in paths))
+
+
+def videoNames(paths: list, folder: str, rows: int, cols: int):
+    """
+    Unique names of videos, for naming their feature stores in folder.
+    ================================================================
+    Output: dict of {path: name}
+    A name is the file name of the video, same as extractor.py, unless
+    the feature store of that name belongs to another video, or the name
+    is given to an earlier video of paths, e.g. "day1/clip.mp4" and
+    "day2/clip.mp4". Then the video is named with 8 digits of SHA-256 of
+    its absolute path, e.g. "clip.mp4.1a2b3c4d". A feature store keeps
+    the path of its video in its header, so names do not change between
+    runs, whichever videos are ingested together.
+    """
+    names = {}
+    takenNames = set()
+    for path in paths:
+        name = os.path.basename(path)
+        owner = _storeVideo(outputPath(folder, name, rows, cols))
+        if (name in takenNames or
+                owner not in (None, os.path.abspath(path))):
+            digest = hashlib.sha256(
+                os.path.abspath(path).encode('utf-8')).hexdigest()
+            name = name + '.' + digest[0:8]
+        takenNames.add(name)
+        names[path] = name
+    return names
+
+
+def outputPath(folder: str, name: str, rows: int, cols: int):
+    """
+    Path of feature store of a video named by videoNames(),
+    e.g. "sample.mp4" ---> "output/sample.mp4.2x8.feat"
+    """
+    return os.path.join(
+        folder, name + '.' + str(rows) + 'x' + str(cols) +
+        featurestore.EXTENSION)
+
+
+def upToDate(videoPath: str, storePath: str, rows: int, cols: int,
+             nSkip: int, sampling: dict = None, levels: list = None):
+    """
+    Checking whether a video needs to be ingested again.
+    ================================================================
+    Output: true if the feature store is complete, newer than the video,
+            extracted from this video by the same parameters, and its
+            saved index is newer than the feature store.
+    The index itself is not loaded, it is checked again by its
+    signature when the feature store is searched.
+    """
+    path = indexstore.indexPath(storePath)
+    if (not os.path.exists(storePath) or not os.path.exists(path) or
+            os.path.exists(featurestore.checkpointPath(storePath))):
+        return False
+    if (os.path.getmtime(storePath) < os.path.getmtime(videoPath) or
+            os.path.getmtime(path) < os.path.getmtime(storePath)):
+        return False
+    try:
+        header = featurestore.readHeader(storePath)
+    except (OSError, ValueError):
+        return False
+    if (header.get('video') != os.path.abspath(videoPath)):
+        return False
+    return _sameParameters(header, rows, cols, nSkip, sampling, levels)
+
+
+def ingesting(paths: list, folder: str, rows: int, cols: int, nSkip: int,
+              nWorker: int, sampling: dict = None, levels: list = None,
+              cacheFolder: str = None, force: bool = False):
+    """
+    Generator of results of ingested videos, in order of completion.
+    ================================================================
+    Output Format: dict of {video, name, store, status, frames, vectors,
+                            seconds, framesPerSecond, error}
+      name: unique name of the video, see videoNames()
+      status: "done", "cached" (copied from cache), "skipped" (up to
+              date) or "failed", see error
+    Videos are sorted by frame count in descending order before they
+    are submitted, so the longest jobs start first. Each process
+    extracts one video serially and builds its index. An interrupted
+    feature store of the same parameters is resumed.
+    cacheFolder: folder of featurecache.FeatureCache, None for no cache
+    force: if true, videos are ingested even if they are up to date
+    """
+    jobs = []
+    names = videoNames(paths, folder, rows, cols)
+    for path in paths:
+        storePath = outputPath(folder, names[path], rows, cols)
+        if (not force and os.path.exists(path) and
+                upToDate(path, storePath, rows, cols, nSkip,
+                         sampling, levels)):
+            yield _result(path, names[path], storePath, 'skipped')
+            continue
+        cap = cv2.VideoCapture(path)
+        if (not cap.isOpened()):
+            yield _result(path, names[path], storePath, 'failed',
+                          error='Video cannot be opened.')
+            continue
+        fps, frameCount = extraction.videoMetadata(cap)
+        cap.release()
+        jobs.append((frameCount, path, storePath))
+
+    # Longest job first, ties are broken by path for a stable order
+    jobs.sort(key=lambda job: (-job[0], job[1]))
+    if (len(jobs) == 0):
+        return
+    with concurrent.futures.ProcessPoolExecutor(
+            max(1, min(nWorker, len(jobs)))) as pool:
+        futures = {}
+        for frameCount, path, storePath in jobs:
+            future = pool.submit(
+                _ingestVideo, path, names[path], storePath, rows, cols, nSkip,
+                sampling, levels, cacheFolder, metrics.enabled())
+            futures[future] = (frameCount, path, storePath)
+        for future in concurrent.futures.as_completed(futures):
+            frameCount, path, storePath = futures[future]
+            try:
+                result, videoMetrics = future.result()
+            except Exception as error:
+                yield _result(path, names[path], storePath, 'failed',
+                              frames=frameCount,
+                              error=f'{type(error).__name__}: {error}')
+                continue
+            # Stage times and counters of worker processes are sent back
+            if (videoMetrics is not None):
+                metrics.merge(videoMetrics)
+            yield result
+
+
+def summary(results: list):
+    """
+    Summary of results of ingesting().
+    ================================================================
+    Output Format: dict of
+      'videos': number of videos, 'failed': [results of failed videos]
+      'status': {status: number of videos}
+      'frames', 'vectors', 'seconds': totals of ingested videos, where
+      seconds is the sum of time spent in each process
+      'framesPerSecond': frames / seconds of ingested videos
+    """
+    status = {}
+    frames, vectors, seconds = 0, 0, 0.0
+    for result in results:
+        status[result['status']] = status.get(result['status'], 0) + 1
+        if (result['status'] in ('done', 'cached')):
+            frames += result['frames']
+            vectors += result['vectors']
+            seconds += result['seconds']
+    return {
+        'videos': len(results),
+        'status': status,
+        'frames': frames,
+        'vectors': vectors,
+        'seconds': seconds,
+        'framesPerSecond': frames / seconds if seconds > 0 else 0.0,
+        'failed': [result for result in results
+                   if result['status'] == 'failed']
+    }
+
+
+##############################################################################
+# ----------Functions for internal uses: Ingest a Video in a Process---------
+##############################################################################
+
+
+def _ingestVideo(path: str, name: str, storePath: str, rows: int, cols: int,
+                 nSkip: int, sampling: dict, levels: list, cacheFolder: str,
+                 collectMetrics: bool):
+    # Extract, store and index one video in a worker process.
+    # Output: (result, snapshot of metrics or None)
+    if (collectMetrics):
+        metrics.enable()
+        metrics.reset()
+    start = time.perf_counter()
+    cap = cv2.VideoCapture(path)
+    if (not cap.isOpened()):
+        raise ValueError('Video cannot be opened.')
+    fps, frameCount = extraction.videoMetadata(cap)
+    source = os.path.basename(path)
+
+    # An interrupted store is only resumed if its parameters are the same
+    savedTimes = featurestore.checkpoint(storePath)
+    if (savedTimes is not None and not _sameParameters(
+            featurestore.readHeader(storePath), rows, cols, nSkip,
+            sampling, levels)):
+        savedTimes = None
+
+    cache, key, cachedPath = None, None, None
+    if (cacheFolder is not None):
+        cache = featurecache.FeatureCache(cacheFolder)
+        key = featurecache.cacheKey(
+            featurecache.fingerprint(path), rows=rows, cols=cols,
+            nSkip=nSkip, dimension=16, sampling=sampling, levels=levels)
+        if (savedTimes is None):
+            cachedPath = cache.get(key, featurestore.EXTENSION)
+
+    if (cachedPath is not None):
+        status = 'cached'
+        if (featurecache.restoreFile(cachedPath, storePath)):
+            featurestore.updateHeader(
+                storePath, source=source, video=os.path.abspath(path))
+    else:
+        status = 'done'
+        startFrame = 0
+        if (savedTimes is not None):
+            startFrame = extraction.resumeFrame(savedTimes, fps, nSkip)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, startFrame)
+        if (sampling is None):
+            frameFeatures = extraction.extractFeatures(
+                cap, rows, cols, nSkip, startFrame=startFrame,
+                showProgress=False, levels=levels)
+        else:
+            frameFeatures = extraction.extractAdaptive(
+                cap, rows, cols, nSkip, sampling['threshold'],
+                sampling['maxGap'], startFrame=startFrame,
+                showProgress=False, levels=levels)
+        featurestore.writeStore(
+            storePath, frameFeatures, fps, rows, cols, source=source,
+            nSkip=nSkip, resume=savedTimes is not None,
+            endTime=frameCount / fps if fps > 0 else None,
+            sampling=sampling, levels=levels, video=path)
+        if (cache is not None):
+            cache.put(key, featurestore.EXTENSION, storePath)
+    cap.release()
+
+    store = featurestore.loadStore(storePath)
+    indexstore.loadOrIndexing(storePath, store)
+    result = _result(path, name, storePath, status, frames=frameCount,
+                     vectors=len(store['times']),
+                     seconds=time.perf_counter() - start)
+    if (not collectMetrics):
+        return result, None
+    return result, metrics.snapshot()
+
+
+def _storeVideo(storePath: str):
+    # Absolute path of the video of a feature store, None if there is no
+    # readable store, "" for a store without the path of its video
+    try:
+        return featurestore.readHeader(storePath).get('video') or ''
+    except (OSError, ValueError):
+        return None
+
+
+def _sameParameters(header: dict, rows: int, cols: int, nSkip: int,
+                    sampling: dict, levels: list):
+    # Return true if a feature store is extracted by these parameters
+    if (levels):
+        levels = [[rows, cols]] + [list(grid) for grid in levels]
+    return (header.get('rows') == rows and header.get('cols') == cols and
+            header.get('nSkip') == nSkip and
+            header.get('sampling') == sampling and
+            header.get('levels') == (levels or None))
+
+
+def _result(path: str, name: str, storePath: str, status: str,
+            frames: int = 0, vectors: int = 0, seconds: float = 0.0,
+            error: str = None):
+    return {
+        'video': path,
+        'name': name,
+        'store': storePath,
+        'status': status,
+        'frames': frames,
+        'vectors': vectors,
+        'seconds': seconds,
+        'framesPerSecond': frames / seconds if seconds > 0 else 0.0,
+        'error': error
+    }
@@ -0,0 +1,137 @@
+"""
+This module is for searching many videos as one library.
+Each video is a shard: its own feature file and its own saved index,
+so adding or removing a video does not rebuild other shards.
+A query is searched in all shards in parallel, and the k nearest results
+of each shard are merged into one ranking.
+"""
+
+import os
+import json
+import heapq
+import concurrent.futures
+from _modules import batchsearch
+from _modules import featurestore
+from _modules import indexstore
+
+# Library File Format: JSON of
+#   {'version': 1, 'rows': n, 'cols': n,
+#    'shards': {videoId: path of feature file, relative to library file}}
+# All shards must have the same grid size, so one query fits all of them.
+VERSION = 1
+
+##############################################################################
+# ----------Functions for external scripts: Library and knnSearching()-------
+##############################################################################
+
+
+def loadLibrary(path: str):
+    """
+    Loading a library file, or an empty library if it does not exist.
+    """
+    if (not os.path.exists(path)):
+        return {'version': VERSION, 'rows': 0, 'cols': 0, 'shards': {}}
+    libraryFile = open(path, 'r')
+    library = json.loads(libraryFile.read())
+    libraryFile.close()
+    return library
+
+
+def saveLibrary(path: str, library: dict):
+    # Written to a temporary file first, so a library is never half-written
+    libraryFile = open(path + '.tmp', 'w')
+    libraryFile.write(json.dumps(library, indent=1, sort_keys=True))
+    libraryFile.close()
+    os.replace(path + '.tmp', path)
+
+
+def addShard(library: dict, libraryPath: str, featuresPath: str,
+             videoId: str = None):
+    """
+    Adding a feature file to a library as a shard.
+    ================================================================
+    Output: videoId, which is the file name of the feature file by
+            default, e.g. "sample.mp4.2x8.feat"
+    The index of the shard is built and saved if it is missing or stale.
+    Other shards are not touched. Adding the same feature file again is
+    allowed, but a videoId of another feature file raises ValueError.
+    """
+    store = featurestore.loadStore(featuresPath)
+    header = store['header']
+    if (library['rows'] == 0):
+        library['rows'], library['cols'] = header['rows'], header['cols']
+    if ((header['rows'], header['cols']) !=
+            (library['rows'], library['cols'])):
+        raise ValueError(
+            f'Grid size of {featuresPath} is not '
+            f'{library["rows"]}x{library["cols"]}.')
+    if (videoId is None):
+        videoId = os.path.basename(featuresPath)
+    path = os.path.relpath(
+        featuresPath, os.path.dirname(os.path.abspath(libraryPath)))
+    if (library['shards'].get(videoId, path) != path):
+        raise ValueError(
+            f'Video id {videoId} is already used by '
+            f'{library["shards"][videoId]}.')
+    indexstore.loadOrIndexing(featuresPath, store)
+    library['shards'][videoId] = path
+    return videoId
+
+
+def removeShard(library: dict, videoId: str):
+    """
+    Removing a shard from a library. Its files are kept on disk.
+    """
+    if (videoId not in library['shards']):
+        raise KeyError('Video is not in library: ' + videoId)
+    del library['shards'][videoId]
+
+
+def shardPaths(library: dict, libraryPath: str):
+    """
+    Output Format: dict of {videoId: path of feature file}
+    """
+    folder = os.path.dirname(os.path.abspath(libraryPath))
+    return {videoId: os.path.join(folder, path)
+            for videoId, path in library['shards'].items()}
+
+
+def knnSearching(library: dict, libraryPath: str, features: list, k: int,
+                 nWorker: int = 8, cache=None):
+    """
+    Searching k nearest feature vectors among all videos of a library.
+    ================================================================
+    Output Format: (nearestMatch, counter) where
+        nearestMatch: list of [videoId, time, [features], distance],
+                      sorted by distance, then by videoId and time
+        counter: number of comparison in all shards
+    Shards are searched by a pool of nWorker threads. NumPy releases
+    the GIL in distance computation, so shards are searched in parallel.
+    If cache is an indexcache.IndexCache, shards are read from it.
+    """
+    paths = shardPaths(library, libraryPath)
+
+    def searchShard(videoId: str):
+        if (cache is not None):
+            store, tree = cache.get(paths[videoId])
+        else:
+            store = featurestore.loadStore(paths[videoId])
+            tree, treeLoaded = indexstore.loadOrIndexing(
+                paths[videoId], store)
+        nearestMatch, counter = batchsearch.batchKnnSearching(
+            tree, store, [features], k)[0]
+        return [[videoId] + match for match in nearestMatch], counter
+
+    with concurrent.futures.ThreadPoolExecutor(nWorker) as pool:
+        shardResults = list(pool.map(searchShard, sorted(paths)))
+
+    # Each shard is sorted by distance, so they are merged by heapq
+    merged = heapq.merge(
+        *[nearestMatch for nearestMatch, counter in shardResults],
+        key=lambda match: (match[3], match[0], match[1]))
+    nearestMatch = []
+    for match in merged:
+        if (len(nearestMatch) >= k):
+            break
+        nearestMatch.append(match)
+    return nearestMatch, sum(result[1] for result in shardResults)
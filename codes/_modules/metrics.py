@@ -0,0 +1,217 @@
+"""
+This module is for recording timings and counters of each stage.
+Metrics are disabled by default, then stage() and count() do nothing.
+They are enabled by enable(), or by environment variables for scripts:
+  SSV_METRICS=output/metrics.jsonl   JSON lines, one line per run
+  SSV_METRICS=output/metrics.prom    Prometheus text format
+  SSV_PROFILE=output/profile.pstats  cProfile of the whole run
+Metrics are written when the script exits.
+Worker processes do not read the environment variables, their metrics
+are sent back to the main process, see merge().
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import functools
+import threading
+import contextlib
+import multiprocessing
+
+# Stages:   decode, reduction, dct, write, build, query
+# Counters: frames, splits, nodesVisited, leafScans, queries
+# Maximums: maxDepth
+_enabled = False
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_maximums = {}
+_nullStage = contextlib.nullcontext()
+
+##############################################################################
+# ----------Functions for external scripts: stage(), count() and export()----
+##############################################################################
+
+
+def enable(path: str = None, profilePath: str = None):
+    """
+    Enabling metrics. If path is given, metrics are exported to it when
+    the script exits. If profilePath is given, the run is profiled by
+    cProfile and saved for pstats or snakeviz.
+    """
+    global _enabled
+    _enabled = True
+    if (path is not None):
+        atexit.register(export, path)
+    if (profilePath is not None):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        atexit.register(_saveProfile, profiler, profilePath)
+
+
+def enabled():
+    return _enabled
+
+
+def stage(name: str):
+    """
+    Context manager to record time of a stage, e.g.
+        with metrics.stage('decode'):
+            frame = cap.read()
+    """
+    if (not _enabled):
+        return _nullStage
+    return _Stage(name)
+
+
+def timed(name: str):
+    """
+    Decorator to record time of every call of a function as a stage.
+    It should not be used on recursive functions, which are nested.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if (not _enabled):
+                return function(*args, **kwargs)
+            with _Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, value: int = 1):
+    # Add value to a counter
+    if (not _enabled):
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def maximum(name: str, value):
+    # Record the maximum of a value, e.g. depth of tree
+    if (not _enabled):
+        return
+    with _lock:
+        _maximums[name] = max(_maximums.get(name, value), value)
+
+
+def snapshot():
+    """
+    Output Format: dict of
+      'stages': {name: {'seconds': total, 'calls': number}}
+      'counters': {name: value}, 'maximums': {name: value}
+      'rates': {'framesPerSecond': frames / seconds of extraction stages}
+    Seconds of stages in worker processes are summed, see merge(), so
+    framesPerSecond of parallel extraction is the rate of one process,
+    not of the wall clock.
+    """
+    with _lock:
+        stages = {name: dict(_stages[name]) for name in _stages}
+        counters = dict(_counters)
+        maximums = dict(_maximums)
+    rates = {}
+    seconds = sum(stages[name]['seconds'] for name in
+                  ('decode', 'reduction', 'dct', 'write') if name in stages)
+    if (counters.get('frames') and seconds > 0):
+        rates['framesPerSecond'] = counters['frames'] / seconds
+    if (counters.get('queries') and 'query' in stages):
+        rates['queriesPerSecond'] = (
+            counters['queries'] / max(stages['query']['seconds'], 1e-9))
+    return {'stages': stages, 'counters': counters,
+            'maximums': maximums, 'rates': rates}
+
+
+def export(path: str):
+    """
+    Writing metrics to a file: Prometheus text format if the file ends
+    with ".prom", which is replaced each time, otherwise a JSON line is
+    appended to the file.
+    """
+    metrics = snapshot()
+    if (path.endswith('.prom')):
+        outputFile = open(path, 'w')
+        outputFile.write(_prometheus(metrics))
+    else:
+        metrics['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        metrics['script'] = os.path.basename(sys.argv[0])
+        outputFile = open(path, 'a')
+        outputFile.write(json.dumps(metrics) + '\n')
+    outputFile.close()
+
+
+def merge(other: dict):
+    """
+    Adding a snapshot() of another process, e.g. a worker process of
+    extraction, into metrics of this process.
+    """
+    if (not _enabled):
+        return
+    with _lock:
+        for name, record in other['stages'].items():
+            merged = _stages.setdefault(name, {'seconds': 0, 'calls': 0})
+            merged['seconds'] += record['seconds']
+            merged['calls'] += record['calls']
+        for name, value in other['counters'].items():
+            _counters[name] = _counters.get(name, 0) + value
+        for name, value in other['maximums'].items():
+            _maximums[name] = max(_maximums.get(name, value), value)
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _maximums.clear()
+
+
+##############################################################################
+# ----------Functions for internal uses: Stage, Prometheus and Profile-------
+##############################################################################
+
+
+class _Stage:
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        seconds = time.perf_counter() - self.start
+        with _lock:
+            record = _stages.setdefault(self.name, {'seconds': 0, 'calls': 0})
+            record['seconds'] += seconds
+            record['calls'] += 1
+        return False
+
+
+def _prometheus(metrics: dict):
+    lines = []
+    for name, record in sorted(metrics['stages'].items()):
+        lines.append(f'ssv_stage_seconds_total{{stage="{name}"}} '
+                     f'{record["seconds"]}')
+        lines.append(f'ssv_stage_calls_total{{stage="{name}"}} '
+                     f'{record["calls"]}')
+    for name, value in sorted(metrics['counters'].items()):
+        lines.append(f'ssv_{name}_total {value}')
+    for name, value in sorted(metrics['maximums'].items()):
+        lines.append(f'ssv_{name} {value}')
+    for name, value in sorted(metrics['rates'].items()):
+        lines.append(f'ssv_{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _saveProfile(profiler, path: str):
+    profiler.disable()
+    profiler.dump_stats(path)
+
+
+if ((os.environ.get('SSV_METRICS') or os.environ.get('SSV_PROFILE')) and
+        multiprocessing.parent_process() is None):
+    enable(os.environ.get('SSV_METRICS'), os.environ.get('SSV_PROFILE'))
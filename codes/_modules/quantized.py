@@ -0,0 +1,159 @@
+"""
+This module is for two-stage searching with compact codes.
+Each dimension of features is quantized to uint8, so a frame costs
+16 bytes in memory. Codes are scanned first by an approximate distance
+for a shortlist, then the shortlist is re-ranked by exact distance on
+full-precision feature vectors of the feature store.
+"""
+
+import os
+import json
+import zipfile
+import numpy as np
+from _modules import featurestore
+from _modules import indexstore
+from _modules import metrics
+
+EXTENSION = '.codes'
+LEVELS = 256
+
+# Codes Format: dict of numpy arrays
+#   'codes': array[count][dimension] of uint8
+#   'low':   array[dimension] = minimum of each dimension
+#   'scale': array[dimension] = step of quantization of each dimension
+# feature ~= low + codes * scale
+
+##############################################################################
+# ----------Functions for external scripts: quantizing() and knnSearching()--
+##############################################################################
+
+
+def codesPath(featuresPath: str):
+    """
+    Path of saved codes for a feature file,
+    e.g. "output/sample.mp4.2x8.feat" ---> "output/codes_sample.mp4.2x8.codes"
+    """
+    folder, name = os.path.split(featuresPath)
+    return os.path.join(
+        folder, 'codes_' + os.path.splitext(name)[0] + EXTENSION)
+
+
+def quantizing(store: dict, chunkSize: int = 1 << 20):
+    """
+    Quantizing feature vectors of a feature store to uint8 codes.
+    ================================================================
+    Output Format: codes, see above.
+    Each dimension is scaled from [min, max] to [0, 255] separately.
+    """
+    featureMatrix = store['features']
+    dimension = featureMatrix.shape[1]
+    if (len(featureMatrix) == 0):
+        return {'codes': np.zeros((0, dimension), dtype=np.uint8),
+                'low': np.zeros(dimension), 'scale': np.ones(dimension)}
+    low = np.asarray(featureMatrix.min(axis=0), dtype=np.float64)
+    high = np.asarray(featureMatrix.max(axis=0), dtype=np.float64)
+    scale = np.maximum(high - low, 1) / (LEVELS - 1)
+    codes = np.zeros(featureMatrix.shape, dtype=np.uint8)
+    for start in range(0, len(featureMatrix), chunkSize):
+        chunk = np.asarray(
+            featureMatrix[start:start + chunkSize], dtype=np.float64)
+        codes[start:start + chunkSize] = _encode(chunk, low, scale)
+    return {'codes': codes, 'low': low, 'scale': scale}
+
+
+def loadOrQuantizing(featuresPath: str, store: dict):
+    """
+    Loading saved codes of a feature file, or quantizing and saving them
+    if they are missing or stale, same as indexstore.loadOrIndexing().
+    ================================================================
+    Output Format: (codes, loaded)
+    """
+    path = codesPath(featuresPath)
+    signature = indexstore.indexSignature(
+        featuresPath, LEVELS,
+        store['header']['rows'], store['header']['cols'])
+    codes = _loadCodes(path, signature)
+    if (codes is not None):
+        return codes, True
+    codes = quantizing(store)
+    # Saved in the same way as an index, so codes are never half-written
+    indexstore.saveIndex(path, codes, signature)
+    return codes, False
+
+
+@metrics.timed('query')
+def knnSearching(codes: dict, store: dict, features: list, k: int,
+                 shortlist: int = None, chunkSize: int = 1 << 20):
+    """
+    Searching k nearest feature vectors by codes, then re-ranking.
+    ================================================================
+    Output Format: (nearestMatch, counter), same as flattree.knnSearching()
+    Stage 1: Approximate distances to all codes are computed in chunks,
+             and the nearest shortlist rows are kept (10 * k by default).
+    Stage 2: Full-precision feature vectors of the shortlist are read
+             from the feature store and ranked by exact distance.
+    A larger shortlist has higher recall but is slower.
+    """
+    if (k < 1):
+        raise ValueError('Number of nearest results must be at least 1.')
+    if (shortlist is None):
+        shortlist = 10 * k
+    shortlist = max(shortlist, k)
+    query = np.asarray(features, dtype=np.float64)
+    # Query is compared in the scale of codes, weighted by step of each
+    # dimension, so distance is approximately the actual distance.
+    queryCodes = ((query - codes['low']) / codes['scale']).astype(np.float32)
+    weights = (codes['scale'] ** 2).astype(np.float32)
+    codeMatrix = codes['codes']
+
+    # Stage 1: bestRows & bestDistances = shortlist found so far
+    bestRows = np.zeros(0, dtype=np.int64)
+    bestDistances = np.zeros(0)
+    for start in range(0, len(codeMatrix), chunkSize):
+        chunk = codeMatrix[start:start + chunkSize].astype(np.float32)
+        distances = (((chunk - queryCodes) ** 2) @ weights)
+        if (len(distances) > shortlist):
+            nearest = np.argpartition(distances, shortlist - 1)[0:shortlist]
+        else:
+            nearest = np.arange(len(distances))
+        bestRows = np.concatenate([bestRows, nearest + start])
+        bestDistances = np.concatenate([bestDistances, distances[nearest]])
+        if (len(bestRows) > shortlist):
+            keep = np.argpartition(bestDistances, shortlist - 1)[0:shortlist]
+            bestRows, bestDistances = bestRows[keep], bestDistances[keep]
+    counter = len(codeMatrix)
+
+    # Stage 2: Exact distance of the shortlist, same as knnScanning()
+    rows = np.sort(bestRows)
+    counter += len(rows)
+    candidates = np.asarray(store['features'][rows], dtype=np.int64)
+    distances = ((candidates - query.astype(np.int64)) ** 2).sum(axis=1)
+    order = np.lexsort((rows, distances))[0:k]
+    return featurestore.rowsToVectors(
+        store, rows[order], np.sqrt(distances[order]) / len(query)), counter
+
+
+##############################################################################
+# ----------Functions for internal uses: Encode and Load Codes----------
+##############################################################################
+
+
+def _encode(featureMatrix, low, scale):
+    # Nearest level of each feature, clipped to [0, LEVELS - 1]
+    levels = np.rint((featureMatrix - low) / scale)
+    return np.clip(levels, 0, LEVELS - 1).astype(np.uint8)
+
+
+def _loadCodes(path: str, signature: dict):
+    # Load codes saved by numpy.savez, None if missing, stale or unreadable
+    if (not os.path.exists(path)):
+        return None
+    try:
+        arrays = np.load(path)
+        if (json.loads(str(arrays['signature'])) != signature):
+            return None
+        codes = {key: arrays[key] for key in ('codes', 'low', 'scale')}
+        arrays.close()
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+    return codes
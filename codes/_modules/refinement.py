@@ -0,0 +1,101 @@
+"""
+This module is for refining search results to the exact frame.
+Feature vectors are usually extracted from sampled frames only, so a
+match is only known to be near a sampled frame. Frames around a match
+are decoded again from the original video and compared one by one.
+"""
+
+import os
+import cv2
+import numpy as np
+from _modules import features
+from _modules import featurestore
+
+##############################################################################
+# ----------Functions for external scripts: refining()----------
+##############################################################################
+
+
+def videoPath(featuresPath: str, store: dict):
+    """
+    Path of the original video of a feature file, which is in folder
+    "input" next to folder "output",
+    e.g. "output/sample.mp4.2x8.feat" ---> "input/sample.mp4"
+    """
+    outputFolder = os.path.dirname(os.path.abspath(featuresPath))
+    return os.path.join(
+        os.path.dirname(outputFolder), 'input', store['header']['source'])
+
+
+def refining(path: str, store: dict, nearestMatch: list,
+             targetFeatures: list):
+    """
+    Refining nearest results to the exact frame in the original video.
+    ================================================================
+    Input:
+      path: original video, see videoPath()
+      nearestMatch: list of [time, [features], distance], e.g. results of
+                    flattree.knnSearching()
+    Output Format: (refinedMatch, counter) where
+        refinedMatch: list of [time, [features], distance], one for each
+                      result, sorted by distance
+        counter: number of decoded frames
+    For a result at a stored frame, frames between the previous and the
+    next stored frames are decoded, and the nearest one is returned.
+    Frames are transformed by features.framesToMeans(), which is the
+    same as features.frameToBlocks() + features.blocksToFeatures().
+    Distance is in the same scale as flattree.knnSearching().
+    """
+    header = store['header']
+    rows, cols = header['rows'], header['cols']
+    times = np.asarray(store['times'])
+    spans = featurestore.timeSpans(store)
+    query = np.asarray(targetFeatures, dtype=np.int64)
+
+    cap = cv2.VideoCapture(path)
+    if (not cap.isOpened()):
+        raise FileNotFoundError('Video is not found: ' + path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    refinedMatch = []
+    counter = 0
+    for match in nearestMatch:
+        row = int(np.searchsorted(times, match[0]))
+        startTime = spans[row - 1][0] if row > 0 else spans[row][0]
+        startFrame = int(round(startTime * fps)) + (1 if row > 0 else 0)
+        stopFrame = int(round(spans[row][1] * fps))
+        frameTimes, frameFeatures = _decodeWindow(
+            cap, startFrame, stopFrame, fps, rows, cols, len(query))
+        counter += len(frameTimes)
+        if (len(frameTimes) == 0):
+            refinedMatch.append(match)
+            continue
+        distances = np.sqrt(((frameFeatures - query) ** 2).sum(axis=1))
+        best = int(np.argmin(distances))
+        refinedMatch.append([
+            frameTimes[best], frameFeatures[best].tolist(),
+            float(distances[best]) / len(query)])
+    cap.release()
+    refinedMatch.sort(key=lambda match: (match[2], match[0]))
+    return refinedMatch, counter
+
+
+##############################################################################
+# ----------Functions for internal uses: Decode a Window of Frames----------
+##############################################################################
+
+
+def _decodeWindow(cap, startFrame: int, stopFrame: int, fps: float,
+                  rows: int, cols: int, dimension: int):
+    # Decode frames in [startFrame, stopFrame] and transform them together
+    cap.set(cv2.CAP_PROP_POS_FRAMES, startFrame)
+    frameTimes = []
+    blockMeans = []
+    for count in range(startFrame, stopFrame + 1):
+        nextFrame, frame = cap.read()
+        if (not nextFrame):
+            break
+        frameTimes.append(count / fps)
+        blockMeans.append(features.framesToMeans(frame, rows, cols))
+    if (len(blockMeans) == 0):
+        return [], np.zeros((0, dimension), dtype=np.int64)
+    return frameTimes, features.meansToFeatures(blockMeans, dimension)
@@ -0,0 +1,296 @@
+"""
+This module is for a resident search service over HTTP.
+Feature vectors and index trees are kept in an IndexCache, so a query on
+a recently searched video does not pay for loading them again.
+Requests are handled by a fixed pool of worker threads.
+"""
+
+import os
+import json
+import time
+import urllib.parse
+import concurrent.futures
+import http.server
+import cv2
+import numpy as np
+from _modules import batchsearch
+from _modules import features
+from _modules import featurestore
+from _modules import flattree
+from _modules import indexcache
+from _modules import metrics
+
+# API:
+#   POST /search?video=<name or "all">&k=<nearest>&rows=<n>&cols=<n>
+#               &budget=<comparisons>&seconds=<time>&radius=<distance>
+#        body = screenshot in any format readable by cv2.imdecode
+#        --> {'results': [{video, exact, similar, nearest, comparisons,
+#                          nearestExact, radius, radiusExact}]}
+#   GET  /videos --> {'videos': [names of feature files]}
+#   GET  /stats  --> counters of IndexCache
+# rows & cols select a level of a feature pyramid, see featurestore.
+# levelStore(), and are only needed for feature files without them, e.g.
+# JSON. A grid which is not stored in a feature file is rejected by 400.
+# For video=all, a video which cannot be loaded is reported as
+# {video, error} and the other videos are still searched.
+# budget & seconds limit the whole request, shared by all videos and all
+# searches in them, then nearestExact tells whether nearest results are
+# exact. Videos after the budget is used up are reported as
+# {video, error} without being loaded.
+# radius adds all frames within the distance, under the same budget.
+
+##############################################################################
+# ----------Functions for external scripts: serve()----------
+##############################################################################
+
+
+class SearchServer(http.server.HTTPServer):
+    """
+    HTTP server with a pool of worker threads and an IndexCache.
+    ================================================================
+    folder: folder of feature files, e.g. "output"
+    budgetBytes: memory budget of the IndexCache
+    nWorker: number of requests handled at the same time
+    """
+
+    def __init__(self, address: tuple, folder: str, budgetBytes: int,
+                 nWorker: int):
+        super().__init__(address, _SearchHandler)
+        self.folder = folder
+        self.cache = indexcache.IndexCache(budgetBytes)
+        self.pool = concurrent.futures.ThreadPoolExecutor(nWorker)
+
+    def process_request(self, request, clientAddress):
+        self.pool.submit(self._processRequest, request, clientAddress)
+
+    def _processRequest(self, request, clientAddress):
+        # Same as socketserver.ThreadingMixIn.process_request_thread()
+        try:
+            self.finish_request(request, clientAddress)
+        except Exception:
+            self.handle_error(request, clientAddress)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+    def videos(self):
+        """
+        Output Format: sorted list of names of feature files in folder.
+        Other files, e.g. library.json or results of batchsearcher.py,
+        are not listed, see _isFeatureFile().
+        """
+        return sorted(
+            name for name in os.listdir(self.folder)
+            if _isFeatureFile(os.path.join(self.folder, name)))
+
+    def search(self, imageBytes: bytes, video: str, k: int,
+               rows: int = None, cols: int = None, budget: int = None,
+               seconds: float = None, radius: float = None):
+        """
+        Searching a screenshot in one video, or all videos in folder.
+        ================================================================
+        Output Format: list of dict, one for each video, see API above
+        Screenshot is converted to features once for each grid size.
+        budget (comparisons) and seconds are for the whole request: each
+        search is given what is left by the searches before it.
+        """
+        image = cv2.imdecode(
+            np.frombuffer(imageBytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if (image is None):
+            raise ValueError('Screenshot cannot be decoded.')
+        metrics.count('queries')
+        if (video == 'all'):
+            names = self.videos()
+        else:
+            names = [os.path.basename(video)]
+
+        results = []
+        queryFeatures = {}
+        limited = budget is not None or seconds is not None
+        deadline = None if seconds is None else time.perf_counter() + seconds
+        # Comparisons of all videos in this request
+        used = 0
+        for name in names:
+            if (limited and _usedUp(budget, deadline, used)):
+                results.append(
+                    {'video': name, 'error': 'Budget of search is used up.'})
+                continue
+            try:
+                store, tree, grid = self._searchStore(name, rows, cols)
+            except (OSError, ValueError, KeyError, IndexError,
+                    TypeError) as error:
+                if (video != 'all'):
+                    raise
+                results.append({'video': name, 'error': str(error)})
+                continue
+            if (grid not in queryFeatures):
+                queryFeatures[grid] = features.meansToFeatures(
+                    features.framesToMeans(image, grid[0], grid[1]))
+            query = np.asarray([queryFeatures[grid]])
+            videoStart = used
+            # Exact and similar matches visit one leaf, it is always done
+            searchResult = batchsearch.batchSearching(tree, store, query)[0]
+            used += searchResult[2]
+            if (not limited):
+                nearestResult = batchsearch.batchKnnSearching(
+                    tree, store, query, k)[0] + (True,)
+                used += nearestResult[1]
+            else:
+                # Counter starts at comparisons used so far, so search
+                # stops when the whole request reaches budget
+                nearestResult = flattree.budgetSearching(
+                    tree, store, queryFeatures[grid], k, budget,
+                    _remaining(deadline), used)
+                used = nearestResult[1]
+            result = {
+                'video': name,
+                'exact': searchResult[0],
+                'similar': searchResult[1],
+                'nearest': nearestResult[0],
+                'nearestExact': nearestResult[2]
+            }
+            if (radius is not None):
+                radiusResult = flattree.radiusSearching(
+                    tree, store, queryFeatures[grid], radius, budget,
+                    _remaining(deadline), used)
+                used = radiusResult[1]
+                result['radius'] = radiusResult[0]
+                result['radiusExact'] = radiusResult[2]
+            result['comparisons'] = used - videoStart
+            results.append(result)
+        return results
+
+    def _searchStore(self, name: str, rows: int, cols: int):
+        # Store and tree of a video in the grid of a request
+        # Output: (store, tree, (rows, cols))
+        path = os.path.join(self.folder, name)
+        store, tree = self.cache.get(path)
+        header = store['header']
+        grid = (rows or header['rows'], cols or header['cols'])
+        if (grid[0] == 0 or grid[1] == 0):
+            raise ValueError('Number of row and column are unknown: ' +
+                             name)
+        # Grid of a JSON file is unknown, it is given by the request
+        if (header['rows'] == 0 or
+                grid == (header['rows'], header['cols'])):
+            return store, tree, grid
+        store, tree = self.cache.get(path, grid[0], grid[1])
+        if (store is None):
+            grids = header.get('levels') or [[header['rows'], header['cols']]]
+            raise ValueError(
+                f'Grid size {grid[0]}x{grid[1]} is not stored in {name}, '
+                'grid sizes are: ' +
+                ' '.join(f'{r}x{c}' for r, c in grids))
+        return store, tree, grid
+
+
+def serve(host: str, port: int, folder: str, budgetBytes: int,
+          nWorker: int = 4):
+    """
+    Running search service until it is interrupted, e.g. by Ctrl + C.
+    """
+    server = SearchServer((host, port), folder, budgetBytes, nWorker)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+##############################################################################
+# ----------Functions for internal uses: HTTP handler----------
+##############################################################################
+
+
+class _SearchHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path
+        if (path == '/stats'):
+            self._reply(200, self.server.cache.stats())
+        elif (path == '/videos'):
+            self._reply(200, {'videos': self.server.videos()})
+        else:
+            self._reply(404, {'error': 'Unknown path: ' + path})
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        if (url.path != '/search'):
+            self._reply(404, {'error': 'Unknown path: ' + url.path})
+            return
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            video = query.get('video', ['all'])[0]
+            k = int(query.get('k', ['5'])[0])
+            rows = int(query.get('rows', ['0'])[0])
+            cols = int(query.get('cols', ['0'])[0])
+            budget = _optional(query, 'budget', int)
+            seconds = _optional(query, 'seconds', float)
+            radius = _optional(query, 'radius', float)
+            if (k < 1):
+                raise ValueError('k must be at least 1.')
+            length = int(self.headers.get('Content-Length', 0))
+            imageBytes = self.rfile.read(length)
+            results = self.server.search(
+                imageBytes, video, k, rows, cols, budget, seconds, radius)
+        except FileNotFoundError as error:
+            self._reply(404, {'error': str(error)})
+            return
+        except ValueError as error:
+            self._reply(400, {'error': str(error)})
+            return
+        except Exception as error:
+            # Connection is not dropped, the client gets the reason
+            self._reply(500, {'error': f'{type(error).__name__}: {error}'})
+            return
+        self._reply(200, {'results': results})
+
+    def _reply(self, status: int, body: dict):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Requests are not logged, to keep the console clean
+        pass
+
+
+def _isFeatureFile(path: str):
+    # Binary feature store, or JSON named "<source>.<rows>x<cols>.json"
+    name = os.path.basename(path)
+    if (name.startswith('index_') or not os.path.isfile(path)):
+        return False
+    if (name.endswith(featurestore.EXTENSION)):
+        return featurestore.isStore(path)
+    nameParts = name.split('.')
+    if (name.endswith('.json') and len(nameParts) >= 3):
+        grid = nameParts[-2].split('x')
+        return (len(grid) == 2 and grid[0].isdigit() and grid[1].isdigit())
+    return False
+
+
+def _usedUp(budget: int, deadline: float, used: int):
+    # Return true if comparisons or time of a request are used up
+    return ((budget is not None and used >= budget) or
+            (deadline is not None and time.perf_counter() >= deadline))
+
+
+def _remaining(deadline: float):
+    # Seconds left before deadline, or None if time is not limited
+    if (deadline is None):
+        return None
+    return max(0.0, deadline - time.perf_counter())
+
+
+def _optional(query: dict, name: str, convert):
+    # Parameter of URL in type of convert, or None if it is not given
+    if (name not in query):
+        return None
+    return convert(query[name][0])
@@ -5,12 +5,14 @@ Only the top-3 features are used for indexing.
 """
 
 import time
+from _modules import metrics
 
 ##############################################################################
 # ----------Functions for external scripts: indexing() and searching()--------
 ##############################################################################
 
 
+@metrics.timed('build')
 def indexing(featureVectors: list, maxChild: int):
     """
     Building index tree of feature vectors.
@@ -45,7 +47,8 @@ def indexing(featureVectors: list, maxChild: int):
     return tree
 
 
-def searching(index: list, features: list, counter=0):
+def searching(index: list, features: list, counter=0,
+              similarThreshold: float = 32, exactThreshold: float = 1):
     """
     Searching in index tree of feature vectors.
     ================================================================
@@ -53,6 +56,8 @@ def searching(index: list, features: list, counter=0):
         exactMatch: list of feature vectors in format [time, [features]]
         similarMatch: list of feature vectors in format [time, [features]]
         counter: number of comparison
+    Similar: _distanceLowerBound() < similarThreshold, 32 by default
+    Exact:   Similar and _distanceActual() < exactThreshold, 1 by default
     """
     if (not index[0][0]):
         # Search in intermediate node
@@ -64,7 +69,8 @@ def searching(index: list, features: list, counter=0):
             locationFlag = _compareBroundary(
                 index[location][0][1:7], features[0:3])
             counter += 1
-        return searching(index[location], features, counter)
+        return searching(index[location], features, counter,
+                         similarThreshold, exactThreshold)
     else:
         # Search in leaf node
         # In worst case, maxChild of comparisons are needed.
@@ -72,9 +78,9 @@ def searching(index: list, features: list, counter=0):
         similarMatch = []
         for i in range(1, len(index)):
             counter += 1
-            if (_distanceLowerBound(index[i][1], features) < 32):   # arbitrarily number
-                similarMatch.append(index[i])                       # not optimized
-                if (_distanceActual(index[i][1], features) < 1):
+            if (_distanceLowerBound(index[i][1], features) < similarThreshold):
+                similarMatch.append(index[i])
+                if (_distanceActual(index[i][1], features) < exactThreshold):
                     exactMatch.append(index[i])
         return exactMatch, similarMatch, counter
 
@@ -214,6 +220,7 @@ def _treeInsertion(inputTree: list, newleaf: list):
 
 def _treeSplit(inputTree: list):
     # Tree is splited if it is full. Leaf nodes will be assigned to sub-trees.
+    metrics.count('splits')
 
     # Step 1: Store children of inputTree in temparery list
     tempList = []
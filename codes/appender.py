@@ -0,0 +1,68 @@
+import sys
+import argparse
+import cv2
+from _modules import extraction
+from _modules import featurestore
+from _modules import indexstore
+
+##############################################################################
+# ----------Append features of a continuation of a stream----------
+##############################################################################
+parser = argparse.ArgumentParser(
+    description='Append feature vectors of a continuation video to an '
+                'existing feature store.')
+parser.add_argument(
+    'features', help='feature vectors, e.g. "output/sample.mp4.2x8.feat"')
+parser.add_argument('video', help='continuation video, e.g. "input/part2.mp4"')
+args = parser.parse_args()
+
+store = featurestore.loadStore(args.features)
+header = store['header']
+cap = cv2.VideoCapture(args.video)
+if (not cap.isOpened()):
+    sys.exit('> ERROR is reading video.')
+fps, frameCount = extraction.videoMetadata(cap)
+nSkip = header['nSkip'] or 0
+sampling = header.get('sampling')
+levels = (header.get('levels') or [[0, 0]])[1:]
+
+# Timestamps continue after the end of the feature store
+timeOffset = 0.0
+if (len(store['times']) > 0):
+    timeOffset = float(featurestore.timeSpans(store)[-1][1])
+# Signature of saved index is read before the feature store is changed
+firstRow = len(store['times'])
+oldSignature = indexstore.indexSignature(
+    args.features, max(1, int(firstRow ** 0.5)), header['rows'],
+    header['cols'])
+del store
+
+
+def shiftedFeatures(frameFeatures):
+    for frameFeature in frameFeatures:
+        yield [frameFeature[0] + timeOffset, frameFeature[1]]
+
+
+print('> ...Extracting features of continuation video...')
+if (sampling is None):
+    frameFeatures = extraction.extractFeatures(
+        cap, header['rows'], header['cols'], nSkip, levels=levels)
+else:
+    frameFeatures = extraction.extractAdaptive(
+        cap, header['rows'], header['cols'], nSkip,
+        sampling['threshold'], sampling['maxGap'], levels=levels)
+nAppended = featurestore.appendStore(
+    args.features, shiftedFeatures(frameFeatures),
+    endTime=timeOffset + frameCount / fps)
+cap.release()
+print(f'> Done. {nAppended} feature vectors are appended.')
+
+# New feature vectors are added into the saved index without rebuilding
+print('> ...Updating search tree...')
+tree, appended = indexstore.appendOrIndexing(
+    args.features, featurestore.loadStore(args.features), oldSignature,
+    firstRow)
+if (not appended):
+    print('> Search tree is rebuilt, since its broundary cannot grow to '
+          'new feature vectors or it is unbalanced.')
+print('> Done. Search tree is saved under folder "output"')
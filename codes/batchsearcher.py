@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import time
+import argparse
+import cv2
+from _modules import batchsearch
+from _modules import featurestore
+from _modules import indexstore
+from _modules import metrics
+from _modules import quantized
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+##############################################################################
+# ----------STEP 1: Read arguments, feature vectors and index----------
+##############################################################################
+parser = argparse.ArgumentParser(
+    description='Search many screenshots in a video in one pass.')
+parser.add_argument(
+    'features', help='feature vectors, e.g. "output/sample.mp4.2x8.feat"')
+parser.add_argument(
+    'images', nargs='+',
+    help='screenshot images, or folders of screenshot images')
+parser.add_argument(
+    '-k', '--nearest', type=int, default=5,
+    help='number of nearest results for each screenshot (default: 5)')
+parser.add_argument(
+    '-o', '--output', default='output/batch_results.json',
+    help='output file in JSON (default: output/batch_results.json)')
+parser.add_argument(
+    '--shortlist', type=int,
+    help='search nearest results by compact codes, then re-rank a '
+         'shortlist of this size (default: exact search)')
+parser.add_argument('--rows', type=int, help='number of row, if not in file')
+parser.add_argument('--cols', type=int, help='number of column, if not in file')
+args = parser.parse_args()
+
+print('> ...Reading feature vectors...')
+featuresStore = featurestore.loadStore(args.features)
+nRow = args.rows or featuresStore['header']['rows']
+nCol = args.cols or featuresStore['header']['cols']
+if (nRow == 0 or nCol == 0):
+    sys.exit('> ERROR: number of row and column are unknown.')
+tree, treeLoaded = indexstore.loadOrIndexing(args.features, featuresStore)
+if (args.shortlist):
+    codes, codesLoaded = quantized.loadOrQuantizing(
+        args.features, featuresStore)
+print(f'> Done. {len(featuresStore["times"])} feature vectors are loaded.')
+
+##############################################################################
+# ----------STEP 2: Import screenshots and convert to query matrix----------
+##############################################################################
+imagePaths = []
+for path in args.images:
+    if (os.path.isdir(path)):
+        for name in sorted(os.listdir(path)):
+            if (name.lower().endswith(IMAGE_EXTENSIONS)):
+                imagePaths.append(os.path.join(path, name))
+    else:
+        imagePaths.append(path)
+
+print(f'> ...Reading {len(imagePaths)} images...')
+images = []
+validPaths = []
+for path in imagePaths:
+    image = cv2.imread(path)
+    if (image is None):
+        print('> ERROR is reading image: ', path)
+    else:
+        images.append(image)
+        validPaths.append(path)
+
+start = time.time()
+queryMatrix = batchsearch.imagesToFeatures(images, nRow, nCol)
+metrics.count('queries', len(queryMatrix))
+
+##############################################################################
+# ----------STEP 3: Search all screenshots and save results----------
+##############################################################################
+print('> ...Comparing feature vectors...')
+searchResults = batchsearch.batchSearching(tree, featuresStore, queryMatrix)
+if (args.shortlist):
+    # Two-stage search: compact codes for a shortlist, then exact distance
+    nearestResults = [
+        quantized.knnSearching(
+            codes, featuresStore, queryMatrix[i], args.nearest,
+            args.shortlist)
+        for i in range(0, len(queryMatrix))]
+else:
+    nearestResults = batchsearch.batchKnnSearching(
+        tree, featuresStore, queryMatrix, args.nearest)
+elapsed = time.time() - start
+
+results = []
+for i in range(0, len(validPaths)):
+    results.append({
+        'image': validPaths[i],
+        'features': queryMatrix[i].tolist(),
+        'exact': searchResults[i][0],
+        'similar': searchResults[i][1],
+        'nearest': nearestResults[i][0],
+        'comparisons': searchResults[i][2] + nearestResults[i][1]
+    })
+summary = {
+    'features': args.features,
+    'rows': nRow,
+    'cols': nCol,
+    'nearest': args.nearest,
+    'queries': len(results),
+    'seconds': elapsed,
+    'queriesPerSecond': len(results) / elapsed if elapsed > 0 else None,
+    'results': results
+}
+outputFile = open(args.output, 'w')
+outputFile.write(json.dumps(summary))
+outputFile.close()
+print(f'> Done. {len(results)} screenshots are searched in {elapsed:.3f} seconds.')
+print('> Results are saved in: ', args.output)
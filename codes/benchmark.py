@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import cv2
+import numpy as np
+from _modules import benchmark
+
+##############################################################################
+# ----------Measure extraction, indexing and search on synthetic videos------
+##############################################################################
+parser = argparse.ArgumentParser(
+    description='Benchmark extraction, indexing and search on synthetic '
+                'videos.')
+parser.add_argument(
+    '-o', '--output', default='output/benchmark.json',
+    help='output file in JSON (default: output/benchmark.json)')
+parser.add_argument(
+    '--quick', action='store_true', help='small videos for a quick check')
+parser.add_argument(
+    '--seed', type=int, default=5422, help='random seed (default: 5422)')
+parser.add_argument(
+    '--queries', type=int, default=20,
+    help='number of screenshots for each video (default: 20)')
+parser.add_argument(
+    '--skip', type=int, default=0,
+    help='number of frames to skip between each reading (default: 0)')
+args = parser.parse_args()
+
+# Commit is recorded, so results can be compared across versions
+try:
+    commit = subprocess.run(
+        ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+except OSError:
+    commit = ''
+
+scenarios = benchmark.QUICK_SCENARIOS if args.quick else benchmark.SCENARIOS
+results = []
+with tempfile.TemporaryDirectory() as folder:
+    for i, scenario in enumerate(scenarios):
+        print(f'> ...Running scenario {i + 1} of {len(scenarios)}: '
+              f'{scenario[0]}...')
+        result = benchmark.runScenario(
+            folder, scenario, args.seed + i, nSkip=args.skip,
+            nQuery=args.queries)
+        results.append(result)
+        for stage in result['stages']:
+            print(f'>>> {stage}: '
+                  f'{result["stages"][stage]["seconds"]:.4f} seconds')
+        print('>>> recall: ', result['recall'])
+
+summary = {
+    'commit': commit,
+    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'seed': args.seed,
+    'python': sys.version.split()[0],
+    'numpy': np.__version__,
+    'opencv': cv2.__version__,
+    'platform': platform.platform(),
+    'processor': platform.processor(),
+    'results': results
+}
+outputFolder = os.path.dirname(args.output)
+if (outputFolder and not os.path.exists(outputFolder)):
+    os.makedirs(outputFolder)
+outputFile = open(args.output, 'w')
+outputFile.write(json.dumps(summary, indent=1))
+outputFile.close()
+print('> Done. Results are saved in: ', args.output)
@@ -0,0 +1,28 @@
+import os
+from _modules import featurestore
+
+##############################################################################
+# ----------STEP 1: Locate feature vectors in JSON----------
+##############################################################################
+print('> Please move the JSON feature vectors into folder "output".')
+featuresName = input('> Please enter filename here, e.g. "sample.mp4.2x8.json": ')
+featuresFps = input('> Please input frame per second of video, or leave it empty: ')
+
+script_dir = os.path.dirname(__file__)
+abs_file_path = os.path.join(script_dir, 'output/' + featuresName)
+if (not os.path.exists(abs_file_path)):
+    print('> ERROR is reading JSON feature vectors.')
+print('')
+
+##############################################################################
+# ----------STEP 2: Convert feature vectors to binary feature store----------
+##############################################################################
+storeName = featuresName[:-len('.json')] + featurestore.EXTENSION
+save_path = os.path.join(script_dir, 'output/' + storeName)
+print('> ...Converting feature vectors into feature store...')
+count = featurestore.convertJson(
+    abs_file_path, save_path, float(featuresFps or 0))
+print(f'> Done. {count} feature vectors are saved under folder "output"')
+print('> File name: ', storeName)
+print('> You may search screenshots by features using "searcher.py".')
+input('> ...Please press Enter to exit...')
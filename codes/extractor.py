@@ -1,130 +1,146 @@
 import os
-import json
 import cv2
-import time
-from _modules import features
-
-##############################################################################
-# ----------STEP 1: Transform Video to Frames for further processing----------
-##############################################################################
-
-
-# Initialized the environment by creating paths
-if not os.path.exists('input'):
-    os.mkdir('input')
-if not os.path.exists('output'):
-    os.mkdir('output')
-
-# Read video
-print('> Please move a video into folder "input".')
-userinputName = input('> Please enter filename here, e.g. "sample.mp4": ')
-videoName = 'input/' + userinputName
-script_dir = os.path.dirname(__file__)
-relative_path = videoName
-abs_file_path = os.path.join(script_dir, relative_path)
-cap = cv2.VideoCapture(abs_file_path)
-if (cap is None):
-    print('> ERROR is reading JSON feature vectors.')
-
-# Extract metadata of video: duration & numbmer of frames
-print('> ...Reading video...')
-fps = cap.get(cv2.CAP_PROP_FPS)
-frameCount = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-duration = frameCount/fps
-print('> frame per second = ' + str(fps))
-print('> number of frames = ' + str(frameCount))
-print('> duration (in seconds) = ' + str(duration))
-
-# Transform video to list of frames
-# Each frame is a 3D array of uint8
-# frames[frame#][height][width][channel] = intensity of one pixel
-nextFrame = True
-frames = []
-start = time.time()
-while(nextFrame):
-
-    # Show progress in percentage
-    now = time.time()
-    if ((now - start) > 6):
-        progressPercentage = int(len(frames) / frameCount * 100)
-        print(f'> Progress: {progressPercentage}%')
-        start = time.time()
-
-    nextFrame, frame = cap.read()
-    frames.append(frame)
-cap.release()
-print('> Done. Frames would be divided into blocks for feature extraction.')
-print('')
-
-##############################################################################
-# ----------STEP 2: Transform Frames to Blocks and extract feature----------
-##############################################################################
-
-# Now start extracting feature vectors
-# frameBlocks = list[block], where block is list of intensity in a block
-# frameFeature = list[features for a frame], extracted from multiple blocks
-# frameFeatures = list[frameFeature]
-frameBlocks = []
-frameFeature = []
-frameFeatures = []
-for p in range(0, frameCount):  # Declare size of frameFeatures
-    frameFeatures.append([])
-nRow = int(input('> Please input the number of row: '))
-nCol = int(input('> Please input the number of column: '))
-nSkip = int(
-    input('> Please input how much frames to skip between each reading: '))
-
-print('> ...Dividing frames to blocks and extracting features...')
-
-start = time.time()
-count = 0
-while (count < frameCount):
-
-    # Show progress in percentage
-    now = time.time()
-    if ((now - start) > 6):
-        progressPercentage = int(count / frameCount * 100)
-        print(f'> Progress: {progressPercentage}%')
-        start = time.time()
-
-    # Insert time into vector, which serves as filePath of an image
-    timepoint = count/fps
-    frameFeatures[count].append(timepoint)
-
-    # Insert features into vector, which serves as UniqueID of an image
-    frameBlocks = features.frameToBlocks(frames[count], nRow, nCol)
-    frameFeature = features.blocksToFeatures(frameBlocks)
-    frameFeatures[count].append(frameFeature)
-
-    # Skip Frames to speed up
-    count += nSkip + 1
-
-print('> Done. Features Vectors would be saved in JSON.')
-print('')
-
-# Remove empty elements
-stop = False
-q = 0
-while (not stop):
-    if (frameFeatures[q] == []):
-        frameFeatures.pop(q)
+from _modules import extraction
+from _modules import featurecache
+from _modules import featurestore
+
+
+# Guard is needed for worker processes of extraction.extractParallel()
+if __name__ == '__main__':
+
+    ##########################################################################
+    # ----------STEP 1: Open Video and read parameters for extraction----------
+    ##########################################################################
+
+
+    # Initialized the environment by creating paths
+    if not os.path.exists('input'):
+        os.mkdir('input')
+    if not os.path.exists('output'):
+        os.mkdir('output')
+
+    # Read video
+    print('> Please move a video into folder "input".')
+    userinputName = input('> Please enter filename here, e.g. "sample.mp4": ')
+    videoName = 'input/' + userinputName
+    script_dir = os.path.dirname(__file__)
+    relative_path = videoName
+    abs_file_path = os.path.join(script_dir, relative_path)
+    cap = cv2.VideoCapture(abs_file_path)
+    if (not cap.isOpened()):
+        print('> ERROR is reading video.')
+
+    # Extract metadata of video: duration & numbmer of frames
+    print('> ...Reading video...')
+    fps, frameCount = extraction.videoMetadata(cap)
+    duration = frameCount/fps
+    print('> frame per second = ' + str(fps))
+    print('> number of frames = ' + str(frameCount))
+    print('> duration (in seconds) = ' + str(duration))
+
+    nRow = int(input('> Please input the number of row: '))
+    nCol = int(input('> Please input the number of column: '))
+    # Extra grid sizes are averaged from the same decoded frames
+    levels = []
+    for grid in input(
+            '> Please input extra grid sizes, e.g. "1x1 4x4", '
+            'or press Enter for none: ').split():
+        levels.append(tuple(int(n) for n in grid.split('x')))
+    nSkip = int(
+        input('> Please input how much frames to skip between each reading: '))
+    # Adaptive sampling keeps a frame only if it is changed from the last one
+    threshold = input(
+        '> Please input threshold of change for adaptive sampling, '
+        'e.g. "8", or press Enter for fixed sampling: ')
+    sampling = None
+    if (threshold != ''):
+        maxGap = float(input(
+            '> Please input the maximum seconds between kept frames: '))
+        sampling = {'threshold': float(threshold), 'maxGap': maxGap}
+    nWorker = int(
+        input('> Please input the number of processes, e.g. "1" for serial: '))
+
+    # An interrupted extraction is resumed after its last saved chunk
+    outputName = (
+        userinputName + '.' + str(nRow) + 'x' + str(nCol) +
+        featurestore.EXTENSION)
+    filename = 'output/' + outputName
+    save_path = os.path.join(script_dir, filename)
+    savedTimes = featurestore.checkpoint(save_path)
+    startFrame = 0
+    if (savedTimes is not None):
+        print(f'> {len(savedTimes)} feature vectors of an interrupted '
+              'extraction are found.')
+        if (input('> Resume the extraction? (y/n): ').lower() == 'y'):
+            startFrame = extraction.resumeFrame(savedTimes, fps, nSkip)
+            print(f'> Extraction is resumed from frame {startFrame}.')
+        else:
+            savedTimes = None
+
+    # A video extracted before, e.g. a renamed copy, is read from cache
+    cache = featurecache.FeatureCache(
+        os.path.join(script_dir, featurecache.FOLDER))
+    cacheKey = featurecache.cacheKey(
+        featurecache.fingerprint(abs_file_path), rows=nRow, cols=nCol,
+        nSkip=nSkip, dimension=16, sampling=sampling, levels=levels)
+    cachedPath = None
+    if (savedTimes is None):
+        cachedPath = cache.get(cacheKey, featurestore.EXTENSION)
+    print('')
+
+    if (cachedPath is not None):
+        print('> Same video is extracted before, feature vectors are copied '
+              'from cache.')
+        # Output is not copied if it is the cached file itself
+        if (featurecache.restoreFile(cachedPath, save_path)):
+            featurestore.updateHeader(
+                save_path, source=userinputName,
+                video=os.path.abspath(abs_file_path))
     else:
-        q += 1
-    if (q == len(frameFeatures)):
-        stop = True
-
-##############################################################################
-# ----------STEP 3: Write feature on disk in JSON format----------
-##############################################################################
 
-outputName = userinputName + '.' + str(nRow) + 'x' + str(nCol) + '.json'
-filename = 'output/' + outputName
-print('> ...Saving feature vectors into JSON file...')
-save_path = os.path.join(script_dir, filename)
-textfile = open(save_path, "w")
-textfile.write(json.dumps(frameFeatures))
-textfile.close()
-print('> Done. Features Vectors is saved in JSON under folder "output"')
-print('> File name: ', outputName)
-print('> You may search screenshots by features using "searcher.py".')
-input('> ...Please press Enter to exit...')
+        ######################################################################
+        # ----------STEP 2: Transform Frames to Blocks and extract feature----
+        ######################################################################
+
+        # Frames are streamed from the video: each frame is a 3D array
+        #   frame[height][width][channel] = intensity of one pixel
+        # It is divided into blocks and reduced to features immediately,
+        # then discarded. Only sampled frames are decoded, so memory usage
+        # is flat.
+        # frameFeatures = generator of [time, [features for a frame]]
+        # For nWorker > 1, video is divided into segments for processes.
+        if (nWorker > 1):
+            frameFeatures = extraction.extractParallel(
+                abs_file_path, nRow, nCol, nSkip, nWorker,
+                startFrame=startFrame, levels=levels, **(sampling or {}))
+        else:
+            if (startFrame > 0):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, startFrame)
+            if (sampling is None):
+                frameFeatures = extraction.extractFeatures(
+                    cap, nRow, nCol, nSkip, startFrame=startFrame,
+                    levels=levels)
+            else:
+                frameFeatures = extraction.extractAdaptive(
+                    cap, nRow, nCol, nSkip, sampling['threshold'],
+                    sampling['maxGap'], startFrame=startFrame, levels=levels)
+
+        ######################################################################
+        # ----------STEP 3: Write feature on disk in binary format----------
+        ######################################################################
+
+        print('> ...Dividing frames to blocks and extracting features...')
+        print('> ...Saving feature vectors into feature store...')
+        # Feature vectors are written in chunks as they are extracted.
+        # Each chunk is a checkpoint, from which extraction can be resumed.
+        featurestore.writeStore(
+            save_path, frameFeatures, fps, nRow, nCol,
+            source=userinputName, nSkip=nSkip,
+            resume=savedTimes is not None, endTime=duration,
+            sampling=sampling, levels=levels, video=abs_file_path)
+        cache.put(cacheKey, featurestore.EXTENSION, save_path)
+    cap.release()
+    print('> Done. Features Vectors is saved under folder "output"')
+    print('> File name: ', outputName)
+    print('> You may search screenshots by features using "searcher.py".')
+    input('> ...Please press Enter to exit...')
@@ -0,0 +1,116 @@
+import os
+import json
+import argparse
+from _modules import ingestion
+from _modules import library
+
+
+# Guard is needed for worker processes of ingestion.ingesting()
+if __name__ == '__main__':
+
+    ##########################################################################
+    # ----------Extract and index all videos in folders or manifests---------
+    ##########################################################################
+    parser = argparse.ArgumentParser(
+        description='Extract feature vectors and indexes of many videos '
+                    'without prompts.')
+    parser.add_argument(
+        'sources', nargs='+',
+        help='folders of videos, or manifest files of one path per line')
+    parser.add_argument(
+        '-o', '--output', default='output',
+        help='folder of feature vectors (default: output)')
+    parser.add_argument(
+        '--rows', type=int, default=2, help='number of row (default: 2)')
+    parser.add_argument(
+        '--cols', type=int, default=8, help='number of column (default: 8)')
+    parser.add_argument(
+        '--levels', nargs='*', default=[],
+        help='extra grid sizes of a feature pyramid, e.g. 1x1 4x4')
+    parser.add_argument(
+        '--skip', type=int, default=0,
+        help='number of frames to skip between each reading (default: 0)')
+    parser.add_argument(
+        '--threshold', type=float, default=None,
+        help='threshold of change for adaptive sampling, e.g. 8 '
+             '(default: fixed sampling)')
+    parser.add_argument(
+        '--max-gap', type=float, default=10.0,
+        help='maximum seconds between kept frames of adaptive sampling '
+             '(default: 10)')
+    parser.add_argument(
+        '--workers', type=int, default=os.cpu_count() or 1,
+        help='number of videos extracted at the same time '
+             '(default: number of CPUs)')
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help='do not read or write cached feature vectors')
+    parser.add_argument(
+        '--force', action='store_true',
+        help='ingest videos again even if they are up to date')
+    parser.add_argument(
+        '--library', default=None,
+        help='library file to add ingested videos to, see librarian.py')
+    parser.add_argument(
+        '--report', default=None,
+        help='file to save results and summary in JSON')
+    args = parser.parse_args()
+
+    levels = [tuple(int(n) for n in grid.split('x')) for grid in args.levels]
+    sampling = None
+    if (args.threshold is not None):
+        sampling = {'threshold': args.threshold, 'maxGap': args.max_gap}
+    cacheFolder = None
+    if (not args.no_cache):
+        cacheFolder = os.path.join(args.output, 'cache')
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+    videoLibrary = None
+    if (args.library is not None):
+        videoLibrary = library.loadLibrary(args.library)
+
+    paths = ingestion.videoPaths(args.sources)
+    print(f'> {len(paths)} videos are found.')
+    print('> ...Extracting feature vectors and building indexes...')
+    results = []
+    for result in ingestion.ingesting(
+            paths, args.output, args.rows, args.cols, args.skip,
+            args.workers, sampling, levels, cacheFolder, args.force):
+        results.append(result)
+        print(f'> [{len(results)}/{len(paths)}] {result["status"]}: '
+              f'{result["video"]}', end='')
+        if (result['status'] == 'failed'):
+            print(' --- ', result['error'])
+        elif (result['status'] == 'skipped'):
+            print('')
+        else:
+            print(f' ({result["vectors"]} feature vectors, '
+                  f'{result["framesPerSecond"]:.1f} frames per second)')
+        # Library is saved after each video, so an interrupted run keeps
+        # the videos which are done
+        if (videoLibrary is not None and result['status'] != 'failed'):
+            # Unique name is the video id, so videos of the same file
+            # name in different folders do not replace each other
+            try:
+                library.addShard(videoLibrary, args.library,
+                                 result['store'], result['name'])
+            except ValueError as error:
+                print('>>> Not added to library: ', error)
+            library.saveLibrary(args.library, videoLibrary)
+
+    summary = ingestion.summary(results)
+    print('')
+    print('> Done. ', ', '.join(
+        f'{summary["status"][status]} {status}'
+        for status in sorted(summary['status'])))
+    print(f'> {summary["frames"]} frames in {summary["seconds"]:.1f} '
+          f'seconds of processes, {summary["framesPerSecond"]:.1f} frames '
+          'per second')
+    for result in summary['failed']:
+        print('>>> Failed: ', result['video'], ' --- ', result['error'])
+    if (args.report is not None):
+        reportFile = open(args.report, 'w')
+        reportFile.write(json.dumps(
+            {'summary': summary, 'results': results}, indent=1))
+        reportFile.close()
+        print('> Results are saved in: ', args.report)
@@ -0,0 +1,71 @@
+import sys
+import argparse
+import cv2
+from _modules import features
+from _modules import library
+from _modules import metrics
+
+##############################################################################
+# ----------Manage a library of videos and search screenshots in it----------
+##############################################################################
+parser = argparse.ArgumentParser(
+    description='Search screenshots among many videos in a library.')
+parser.add_argument(
+    '--library', default='output/library.json',
+    help='library file (default: output/library.json)')
+commands = parser.add_subparsers(dest='command', required=True)
+addParser = commands.add_parser('add', help='add feature files as videos')
+addParser.add_argument('features', nargs='+', help='feature files')
+removeParser = commands.add_parser('remove', help='remove videos')
+removeParser.add_argument('videos', nargs='+', help='video ids')
+commands.add_parser('list', help='list videos')
+searchParser = commands.add_parser('search', help='search a screenshot')
+searchParser.add_argument('image', help='screenshot image')
+searchParser.add_argument(
+    '-k', '--nearest', type=int, default=5,
+    help='number of nearest results (default: 5)')
+searchParser.add_argument(
+    '--workers', type=int, default=8,
+    help='number of videos searched at the same time (default: 8)')
+args = parser.parse_args()
+
+videoLibrary = library.loadLibrary(args.library)
+if (args.command == 'add'):
+    for path in args.features:
+        print('> ...Adding video: ', path)
+        try:
+            videoId = library.addShard(videoLibrary, args.library, path)
+        except ValueError as error:
+            print('>>> Skipped: ', error)
+            continue
+        print('> Done. Video id: ', videoId)
+    library.saveLibrary(args.library, videoLibrary)
+
+elif (args.command == 'remove'):
+    for videoId in args.videos:
+        library.removeShard(videoLibrary, videoId)
+        print('> Removed video: ', videoId)
+    library.saveLibrary(args.library, videoLibrary)
+
+elif (args.command == 'list'):
+    print(f'> {len(videoLibrary["shards"])} videos of grid size '
+          f'{videoLibrary["rows"]}x{videoLibrary["cols"]}:')
+    for videoId in sorted(videoLibrary['shards']):
+        print('>>> ', videoId, videoLibrary['shards'][videoId])
+
+else:
+    targetImg = cv2.imread(args.image)
+    if (targetImg is None):
+        sys.exit('> ERROR is reading image')
+    targetFeature = features.meansToFeatures(
+        features.framesToMeans(
+            targetImg, videoLibrary['rows'], videoLibrary['cols']))
+    print('> ...Comparing feature vectors among all videos...')
+    metrics.count('queries')
+    nearestResult = library.knnSearching(
+        videoLibrary, args.library, targetFeature, args.nearest,
+        args.workers)
+    print(f'> Done. {nearestResult[1]} comparisons are performed.')
+    print('> Nearest match results in [video, time, [features], distance]: ')
+    for i in range(0, len(nearestResult[0])):
+        print('>>> ', nearestResult[0][i])
@@ -1,41 +1,44 @@
 import os
-import json
-import cv2
-from _modules import features
-from _modules import searchtree
+from _modules import bruteforce
+from _modules import featurecache
+from _modules import featurestore
+from _modules import flattree
+from _modules import indexstore
+from _modules import metrics
+from _modules import refinement
 
 ##############################################################################
-# ----------STEP 1: Import feature vectors in JSON----------
+# ----------STEP 1: Import feature vectors in feature store or JSON----------
 ##############################################################################
-print('> Please move the JSON feature vectors into folder "output".')
-featuresName = input('> Please enter filename here, e.g. "sample.mp4.2x8.json": ')
+print('> Please move the feature vectors into folder "output".')
+featuresName = input('> Please enter filename here, e.g. "sample.mp4.2x8.feat": ')
 
-print('> ...Reading JSON feature vectors...')
+print('> ...Reading feature vectors...')
 featuresName = 'output/' + featuresName
 script_dir = os.path.dirname(__file__)
 relative_path = featuresName
 abs_file_path = os.path.join(script_dir, relative_path)
-featuresFile = open(abs_file_path, "r")
-if (featuresFile is None):
-    print('> ERROR is reading JSON feature vectors.')
+if (not os.path.exists(abs_file_path)):
+    print('> ERROR is reading feature vectors.')
 else:
     print('> Done. Search tree would be builded using the feature vectors.')
-featuresList = json.loads(featuresFile.read())
+# Binary feature store is memory-mapped; JSON file is parsed as before
+featuresStore = featurestore.loadStore(abs_file_path)
+featuresCount = len(featuresStore['times'])
 print('')
 
 ##############################################################################
-# ----------STEP 2: Build a tree using feature vectors for searching----------
+# ----------STEP 2: Load or build a tree using feature vectors for searching--
 ##############################################################################
-print('> ...Building search tree using feature vectors...')
-tree = searchtree.indexing(featuresList, int((len(featuresList) ** 0.5)))
-
-treeName = 'output/index_' + featuresName[7:]
-print('> ...Saving index into JSON file...')
-save_path = os.path.join(script_dir, treeName)
-textfile = open(save_path, "w")
-textfile.write(json.dumps(tree))
-textfile.close()
-print('> Done. Search tree is saved in JSON under folder "output"')
+# Saved index is reused unless feature vectors or parameters are changed
+print('> ...Loading or building search tree using feature vectors...')
+tree, treeLoaded = indexstore.loadOrIndexing(abs_file_path, featuresStore)
+if (treeLoaded):
+    print('> Done. Search tree is loaded from folder "output"')
+else:
+    print('> Done. Search tree is builded and saved under folder "output"')
+treeName = indexstore.indexPath(featuresName)
+print('> File name: ', treeName[7:])
 print('')
 
 ##############################################################################
@@ -50,18 +53,29 @@ targetName = 'input/' + targetName
 script_dir = os.path.dirname(__file__)
 relative_path = targetName
 abs_file_path = os.path.join(script_dir, relative_path)
-targetImg = cv2.imread(abs_file_path)
-if (targetImg is None):
+if (not os.path.exists(abs_file_path)):
     print('> ERROR is reading image')
 else:
     print('> Done. Image would be divided into blocks for feature extraction.')
+# Features of a screenshot searched before are read from cache
+imageCache = featurecache.FeatureCache(
+    os.path.join(script_dir, featurecache.FOLDER))
 
-nRow = int(input('> Please input the number of row: '))
-nCol = int(input('> Please input the number of column: '))
+# A feature pyramid can be searched in any of its grid sizes
+searchStore = None
+while (searchStore is None):
+    nRow = int(input('> Please input the number of row: '))
+    nCol = int(input('> Please input the number of column: '))
+    searchStore = featurestore.levelStore(featuresStore, nRow, nCol)
+    if (searchStore is None):
+        grids = featuresStore['header'].get('levels') or [
+            [featuresStore['header']['rows'], featuresStore['header']['cols']]]
+        print('> ERROR: feature vectors of this grid size are not found. '
+              'Grid sizes are: ', ' '.join(f'{r}x{c}' for r, c in grids))
 print('> ...Dividing image to blocks and extracting features...')
-targetFeature = features.blocksToFeatures(
-    features.frameToBlocks(targetImg, nRow, nCol)
-)
+targetFeature = featurecache.imageFeatures(
+    imageCache, abs_file_path, nRow, nCol)
+metrics.count('queries')
 print('> Done. Corresponding features cector:')
 print('> ', targetFeature)
 print('')
@@ -70,9 +84,14 @@ print('')
 # ----------STEP 4: Search features among the tree and return result----------
 ##############################################################################
 
+# Search tree is built by the first grid size of feature vectors
 print('> ...Comparing feature vectors')
-searchResult = searchtree.searching(tree, targetFeature)
-print(f'> Done. {searchResult[2]} comparisons are performed among {len(featuresList)} features vectors.')
+if (searchStore is featuresStore):
+    searchResult = flattree.searching(tree, featuresStore, targetFeature)
+else:
+    searchResult = ([], [], 0)
+    print('> Exact and similar matches are only searched in the first grid.')
+print(f'> Done. {searchResult[2]} comparisons are performed among {featuresCount} features vectors.')
 print('> Exact match results: ', targetFeature)
 for i in range(0, len(searchResult[0])):
     print('>>> ', searchResult[0][i])
@@ -81,4 +100,53 @@ for i in range(0, len(searchResult[1])):
     print('>>> ', searchResult[1][i])
 print('')
 
+# Nearest match results are ranked by distance among all 16 features
+nNearest = int(input('> Please input the number of nearest results, e.g. "5": '))
+# Coarsest level of a feature pyramid is scanned for candidates first
+coarseGrid = None
+if (featuresStore['header'].get('levels')):
+    coarseGrid = min(
+        featuresStore['header']['levels'], key=lambda grid: grid[0] * grid[1])
+if (coarseGrid is not None and coarseGrid != [nRow, nCol]):
+    print(f'> ...Searching nearest feature vectors by {coarseGrid[0]}x'
+          f'{coarseGrid[1]}, then ranking by {nRow}x{nCol}')
+    coarseFeature = featurecache.imageFeatures(
+        imageCache, abs_file_path, coarseGrid[0], coarseGrid[1])
+    nearestResult = bruteforce.knnCoarseToFine(
+        featurestore.levelStore(featuresStore, coarseGrid[0], coarseGrid[1]),
+        searchStore, coarseFeature, targetFeature, nNearest)
+# Small videos are scanned by NumPy, which is faster than tree search
+elif (bruteforce.preferScanning(featuresStore) or
+        searchStore is not featuresStore):
+    print('> ...Searching nearest feature vectors by scanning')
+    nearestResult = bruteforce.knnScanning(
+        searchStore, targetFeature, nNearest)
+else:
+    print('> ...Searching nearest feature vectors by search tree')
+    nearestResult = flattree.knnSearching(
+        tree, featuresStore, targetFeature, nNearest)
+print(f'> Done. {nearestResult[1]} comparisons are performed among {featuresCount} features vectors.')
+print('> Nearest match results in [time, [features], distance]: ')
+for i in range(0, len(nearestResult[0])):
+    print('>>> ', nearestResult[0][i])
+print('')
+
+##############################################################################
+# ----------STEP 5: Refine nearest results to the exact frame----------
+##############################################################################
+# Frames around each result are decoded again from the original video
+videoName = refinement.videoPath(
+    os.path.join(script_dir, featuresName), featuresStore)
+if (os.path.exists(videoName) and
+        input('> Refine nearest results to the exact frame? (y/n): ') == 'y'):
+    print('> ...Decoding frames around nearest results...')
+    # Frames are decoded on the grid size of targetFeature
+    refinedResult = refinement.refining(
+        videoName, searchStore, nearestResult[0], targetFeature)
+    print(f'> Done. {refinedResult[1]} frames are decoded.')
+    print('> Refined results in [time, [features], distance]: ')
+    for i in range(0, len(refinedResult[0])):
+        print('>>> ', refinedResult[0][i])
+    print('')
+
 input('> ...Please press Enter to exit...')
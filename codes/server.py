@@ -0,0 +1,30 @@
+import argparse
+from _modules import searchserver
+
+##############################################################################
+# ----------Run a resident search service for screenshots----------
+##############################################################################
+parser = argparse.ArgumentParser(
+    description='Search screenshots in videos by a resident HTTP service.')
+parser.add_argument(
+    '--folder', default='output',
+    help='folder of feature vectors (default: output)')
+parser.add_argument(
+    '--host', default='127.0.0.1', help='host (default: 127.0.0.1)')
+parser.add_argument(
+    '--port', type=int, default=8000, help='port (default: 8000)')
+parser.add_argument(
+    '--memory', type=int, default=1024,
+    help='memory budget of cached videos in MB (default: 1024)')
+parser.add_argument(
+    '--workers', type=int, default=4,
+    help='number of requests handled at the same time (default: 4)')
+args = parser.parse_args()
+
+print(f'> Search service is running on http://{args.host}:{args.port}')
+print('> e.g. curl --data-binary @input/screenshot.jpg '
+      f'"http://{args.host}:{args.port}/search?video=all&k=5"')
+print('> ...Please press Ctrl + C to exit...')
+searchserver.serve(
+    args.host, args.port, args.folder, args.memory * 1024 * 1024,
+    args.workers)
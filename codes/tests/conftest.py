@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Scripts import modules as "from _modules import x" from folder "codes"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,12 @@
+from _modules import benchmark
+
+
+def test_run_scenario(tmp_path):
+    scenario = ('tiny-motion', 64, 48, 12, 'motion')
+    result = benchmark.runScenario(str(tmp_path), scenario, 5422, nQuery=4,
+                                   k=3)
+    assert result['scenario']['featureVectors'] == 12
+    for stage in ('extraction', 'indexing', 'searching', 'knnSearching'):
+        assert result['stages'][stage]['seconds'] >= 0
+    assert 0 <= result['recall']['frameFound'] <= 1
+    assert result['recall']['knnSearching'] == 1.0
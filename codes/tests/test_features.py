@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+from _modules import features
+
+
+@pytest.mark.parametrize('rows, cols', [(3, 4), (2, 6), (1, 3), (2, 8)])
+def test_batch_features_same_as_blocks(rows, cols):
+    random = np.random.default_rng(2)
+    frames = random.integers(0, 256, (300, 12, 16, 3)).astype(np.uint8)
+    batch = features.meansToFeatures(
+        features.framesToMeans(frames, rows, cols))
+    for i in range(0, len(frames)):
+        # Original per-pixel functions, which queries are transformed by
+        expected = features.blocksToFeatures(
+            features.frameToBlocks(frames[i].tolist(), rows, cols))
+        assert batch[i].tolist() == expected
@@ -0,0 +1,65 @@
+import numpy as np
+from _modules import bruteforce
+from _modules import flattree
+
+
+def _store(featureMatrix):
+    return {'header': {}, 'times': np.arange(len(featureMatrix)) / 10,
+            'features': featureMatrix}
+
+
+def test_appending_grows_root():
+    random = np.random.default_rng(14)
+    old = random.integers(-50, 50, (400, 16))
+    # New rows are far outside the old root, below and above it
+    new = np.concatenate([random.integers(-400, -100, (30, 16)),
+                          random.integers(100, 400, (30, 16))])
+    store = _store(old)
+    maxChild = 20
+    tree = flattree.indexing(store, maxChild)
+    store = _store(np.concatenate([old, new]))
+    tree = flattree.appending(tree, store, len(old), maxChild)
+    assert tree is not None
+    assert len(tree['rows']) == len(old) + len(new)
+
+    for row in range(0, len(store['features'])):
+        query = store['features'][row].tolist()
+        # Each row is found by descent, also on broundary of the old root
+        exactMatch, similarMatch, counter = flattree.searching(
+            tree, store, query)
+        assert store['times'][row] in [match[0] for match in exactMatch]
+        nearest, counter = flattree.knnSearching(tree, store, query, 5)
+        expected, counter = bruteforce.knnScanning(store, query, 5)
+        assert ([match[2] for match in nearest] ==
+                [match[2] for match in expected])
+
+
+def test_appending_rebuilds_zero_extent_root():
+    random = np.random.default_rng(14)
+    old = random.integers(-50, 50, (100, 16))
+    old[:, 2] = 0
+    store = _store(old)
+    tree = flattree.indexing(store, 10)
+    new = old[0:1] + 0
+    new[0, 2] = 1
+    # Side of zero length cannot be doubled, so the tree is rebuilt
+    store = _store(np.concatenate([old, new]))
+    assert flattree.appending(tree, store, len(old), 10) is None
+
+
+def test_budget_is_not_exceeded_in_a_leaf():
+    # Leaf of identical points is never splited, so it is very large
+    store = _store(np.zeros((5000, 16), dtype=np.int64))
+    tree = flattree.indexing(store, 70)
+    nearest, counter, exact = flattree.budgetSearching(
+        tree, store, [0] * 16, 3, maxComparisons=10)
+    assert counter <= 10
+    assert not exact
+    assert len(nearest) == 3
+    nearest, counter, exact = flattree.budgetSearching(
+        tree, store, [0] * 16, 3, seconds=0)
+    assert counter <= flattree.LEAF_CHUNK
+    assert not exact
+    nearest, counter, exact = flattree.budgetSearching(
+        tree, store, [0] * 16, 3, maxComparisons=10000)
+    assert counter == 5000 and exact
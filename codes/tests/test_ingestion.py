@@ -0,0 +1,69 @@
+import os
+import cv2
+import numpy as np
+from _modules import featurestore
+from _modules import ingestion
+
+
+def _writeVideo(path: str, count: int):
+    # Video of frames in random colors, so each frame is different
+    random = np.random.default_rng(2019)
+    writer = cv2.VideoWriter(
+        path, cv2.VideoWriter_fourcc(*'MJPG'), 10.0, (64, 48))
+    for i in range(0, count):
+        writer.write(cv2.resize(
+            random.integers(0, 256, (2, 8, 3)).astype(np.uint8), (64, 48),
+            interpolation=cv2.INTER_NEAREST))
+    writer.release()
+
+
+def test_video_names_of_same_file_name(tmp_path):
+    paths = [os.path.join('day1', 'clip.mp4'),
+             os.path.join('day2', 'clip.mp4'),
+             os.path.join('day2', 'other.mp4')]
+    names = ingestion.videoNames(paths, str(tmp_path), 2, 8)
+    assert names[paths[0]] == 'clip.mp4'
+    assert names[paths[1]].startswith('clip.mp4.')
+    assert names[paths[2]] == 'other.mp4'
+    assert (ingestion.outputPath('output', names[paths[0]], 2, 8) !=
+            ingestion.outputPath('output', names[paths[1]], 2, 8))
+
+
+def test_video_names_are_kept_between_runs(tmp_path):
+    for day in ('day1', 'day2'):
+        os.makedirs(str(tmp_path / day))
+        _writeVideo(str(tmp_path / day / 'clip.avi'), 6)
+    folder = str(tmp_path / 'output')
+    os.makedirs(folder)
+    day1, day2 = (str(tmp_path / 'day1' / 'clip.avi'),
+                  str(tmp_path / 'day2' / 'clip.avi'))
+    first = list(ingestion.ingesting([day1], folder, 2, 8, 0, 1))
+    assert first[0]['name'] == 'clip.avi'
+    # Store of the name belongs to day1, so day2 is not skipped over it
+    second = list(ingestion.ingesting([day2], folder, 2, 8, 0, 1))
+    assert second[0]['status'] == 'done'
+    assert second[0]['name'] != 'clip.avi'
+    assert featurestore.readHeader(first[0]['store'])['video'] == day1
+    both = list(ingestion.ingesting([day2, day1], folder, 2, 8, 0, 1))
+    statuses = {result['name']: result['status'] for result in both}
+    assert statuses == {first[0]['name']: 'skipped',
+                        second[0]['name']: 'skipped'}
+
+
+def test_same_video_extracted_twice(tmp_path):
+    videoPath = str(tmp_path / 'clip.avi')
+    _writeVideo(videoPath, 12)
+    folder = str(tmp_path / 'output')
+    os.makedirs(folder)
+    cacheFolder = os.path.join(folder, 'cache')
+    first = list(ingestion.ingesting(
+        [videoPath], folder, 2, 8, 0, 1, cacheFolder=cacheFolder))
+    assert first[0]['status'] == 'done'
+    # Output store is hard-linked into the cache, then read from cache
+    second = list(ingestion.ingesting(
+        [videoPath], folder, 2, 8, 0, 1, cacheFolder=cacheFolder,
+        force=True))
+    assert second[0]['status'] == 'cached', second[0]['error']
+    store = featurestore.loadStore(first[0]['store'])
+    assert len(store['times']) == 12
+    assert store['header']['source'] == 'clip.avi'
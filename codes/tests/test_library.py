@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from _modules import featurestore
+from _modules import library
+
+
+def _writeStore(path: str):
+    random = np.random.default_rng(13)
+    frameFeatures = [[i / 10, random.integers(-99, 99, 16).tolist()]
+                     for i in range(0, 8)]
+    featurestore.writeStore(path, frameFeatures, 10.0, 2, 8,
+                            source='clip.mp4')
+
+
+def test_add_shards_of_same_source(tmp_path):
+    libraryPath = str(tmp_path / 'library.json')
+    videoLibrary = library.loadLibrary(libraryPath)
+    # Both stores have source "clip.mp4" in their header
+    paths = [str(tmp_path / 'clip.mp4.2x8.feat'),
+             str(tmp_path / 'clip.mp4.1a2b3c4d.2x8.feat')]
+    for path in paths:
+        _writeStore(path)
+        library.addShard(videoLibrary, libraryPath, path)
+    assert sorted(videoLibrary['shards']) == [
+        'clip.mp4.1a2b3c4d.2x8.feat', 'clip.mp4.2x8.feat']
+
+
+def test_add_shard_of_used_video_id(tmp_path):
+    libraryPath = str(tmp_path / 'library.json')
+    videoLibrary = library.loadLibrary(libraryPath)
+    # Stores of videos of the same file name in different folders
+    for day in ('day1', 'day2'):
+        (tmp_path / day).mkdir()
+        _writeStore(str(tmp_path / day / 'clip.mp4.2x8.feat'))
+    first = library.addShard(videoLibrary, libraryPath,
+                             str(tmp_path / 'day1' / 'clip.mp4.2x8.feat'))
+    assert first == 'clip.mp4.2x8.feat'
+    # Same file again is allowed, another file of the same id is not
+    library.addShard(videoLibrary, libraryPath,
+                     str(tmp_path / 'day1' / 'clip.mp4.2x8.feat'))
+    with pytest.raises(ValueError):
+        library.addShard(videoLibrary, libraryPath,
+                         str(tmp_path / 'day2' / 'clip.mp4.2x8.feat'))
+    second = library.addShard(videoLibrary, libraryPath,
+                              str(tmp_path / 'day2' / 'clip.mp4.2x8.feat'),
+                              'day2')
+    assert library.shardPaths(videoLibrary, libraryPath) == {
+        first: str(tmp_path / 'day1' / 'clip.mp4.2x8.feat'),
+        second: str(tmp_path / 'day2' / 'clip.mp4.2x8.feat')}
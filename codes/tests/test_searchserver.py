@@ -0,0 +1,132 @@
+import os
+import json
+import threading
+import urllib.error
+import urllib.request
+import cv2
+import numpy as np
+import pytest
+from _modules import features
+from _modules import featurestore
+from _modules import searchserver
+
+
+def _frames(count: int):
+    # Each block of 2x8 has its own random color, so frames are far apart
+    random = np.random.default_rng(5422)
+    return [cv2.resize(random.integers(0, 256, (2, 8, 3)).astype(np.uint8),
+                       (64, 48), interpolation=cv2.INTER_NEAREST)
+            for i in range(0, count)]
+
+
+@pytest.fixture
+def server(tmp_path):
+    frames = _frames(20)
+    frameFeatures = [
+        [i / 10,
+         features.meansToFeatures(features.framesToMeans(frame, 2, 8))]
+        for i, frame in enumerate(frames)]
+    featurestore.writeStore(
+        str(tmp_path / ('sample.mp4.2x8' + featurestore.EXTENSION)),
+        frameFeatures, 10.0, 2, 8, source='sample.mp4')
+    # Other JSON files in the folder, e.g. a library, are not videos
+    (tmp_path / 'library.json').write_text('{"rows": 2, "shards": {}}')
+    (tmp_path / 'batch_results.json').write_text('[]')
+
+    searchServer = searchserver.SearchServer(
+        ('127.0.0.1', 0), str(tmp_path), 64 * 1024 * 1024, 2)
+    thread = threading.Thread(target=searchServer.serve_forever, daemon=True)
+    thread.start()
+    yield searchServer, frames
+    searchServer.shutdown()
+    searchServer.server_close()
+    thread.join()
+
+
+def _post(searchServer, query: str, image):
+    imageBytes = cv2.imencode('.png', image)[1].tobytes()
+    url = (f'http://127.0.0.1:{searchServer.server_address[1]}'
+           f'/search?{query}')
+    request = urllib.request.Request(url, data=imageBytes, method='POST')
+    try:
+        response = urllib.request.urlopen(request, timeout=30)
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+    return response.status, json.loads(response.read())
+
+
+def test_search_screenshot(server):
+    searchServer, frames = server
+    status, body = _post(searchServer, 'video=sample.mp4.2x8.feat&k=3',
+                         frames[7])
+    assert status == 200
+    result = body['results'][0]
+    assert result['video'] == 'sample.mp4.2x8.feat'
+    assert len(result['nearest']) == 3
+    assert result['nearest'][0][0] == pytest.approx(0.7)
+    assert [match[0] for match in result['exact']] == [pytest.approx(0.7)]
+
+
+def test_search_all_videos_skips_other_json(server):
+    searchServer, frames = server
+    status, body = _post(searchServer, 'video=all&k=1', frames[3])
+    assert status == 200
+    assert [result['video'] for result in body['results']] == [
+        'sample.mp4.2x8.feat']
+
+
+def test_search_rejects_invalid_k(server):
+    searchServer, frames = server
+    status, body = _post(searchServer, 'video=all&k=0', frames[3])
+    assert status == 400
+    assert 'error' in body
+
+
+def test_search_budget_is_shared_by_request(server):
+    searchServer, frames = server
+    status, body = _post(
+        searchServer, 'video=sample.mp4.2x8.feat&k=3&budget=1&radius=100',
+        frames[7])
+    assert status == 200
+    result = body['results'][0]
+    # Exact and similar matches use up the budget of the whole request
+    assert result['nearestExact'] is False
+    assert result['radiusExact'] is False
+    assert result['nearest'] == [] and result['radius'] == []
+
+    status, body = _post(
+        searchServer, 'video=sample.mp4.2x8.feat&k=3&budget=100000',
+        frames[7])
+    assert status == 200
+    assert body['results'][0]['nearestExact'] is True
+    assert body['results'][0]['nearest'][0][0] == pytest.approx(0.7)
+
+
+def test_search_rejects_grid_not_stored(server):
+    searchServer, frames = server
+    status, body = _post(
+        searchServer, 'video=sample.mp4.2x8.feat&k=3&rows=4&cols=4',
+        frames[7])
+    assert status == 400
+    assert '4x4' in body['error']
+
+
+def test_search_level_of_pyramid(server):
+    searchServer, frames = server
+    grids = [(2, 8), (2, 2)]
+    frameFeatures = [
+        [i / 10, np.concatenate([
+            features.meansToFeatures(features.framesToMeans(frame, r, c))
+            for r, c in grids]).tolist()]
+        for i, frame in enumerate(frames)]
+    featurestore.writeStore(
+        os.path.join(searchServer.folder,
+                     'pyramid.mp4.2x8' + featurestore.EXTENSION),
+        frameFeatures, 10.0, 2, 8, source='pyramid.mp4', levels=grids[1:])
+    status, body = _post(
+        searchServer, 'video=pyramid.mp4.2x8.feat&k=3&rows=2&cols=2',
+        frames[7])
+    assert status == 200
+    result = body['results'][0]
+    assert result['nearest'][0][0] == pytest.approx(0.7)
+    assert [match[0] for match in result['exact']] == [pytest.approx(0.7)]